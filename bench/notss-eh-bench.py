@@ -0,0 +1,624 @@
+#!/usr/bin/env python
+
+'''notss-eh-bench - Event storm benchmark for notss-eh.
+
+Replays synthetic events through the event-handler against local stand-ins
+for NRPE, "check_nrpe", "mon", a SSH server and the "ssh" client and reports
+throughput, handler latency, CPU time per event and peak memory usage.'''
+
+try:
+    import SocketServer
+    import argparse
+    import resource
+    import tempfile
+    import threading
+    import random
+    import shutil
+    import socket
+    import struct
+    import Queue
+    import json
+    import time
+    import sys
+    import os
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+# The event-handler is located in the parent directory
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+script_path = os.path.join(root, 'notss-eh.py')
+client_path = os.path.join(root, 'notss-eh-client.py')
+
+
+# Parses command line arguments
+def aparser():
+    parser = argparse.ArgumentParser(
+        description=sys.modules['__main__'].__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('-n', '--events', help='Number of events to replay',
+                        type=int, default=1000)
+
+    parser.add_argument('-c', '--concurrency',
+                        help='Number of events handled concurrently',
+                        type=int, default=8)
+
+    parser.add_argument(
+        '-M', '--mode',
+        help='Spawn the event-handler for every event (like Nagios), ' +
+        'forward events to a daemon with the client or handle them ' +
+        'in-process',
+        choices=('spawn', 'client', 'inprocess'), default='spawn')
+
+    parser.add_argument(
+        '-m', '--module',
+        help='Execution module and stand-in to use ("ssh" uses the ' +
+        'Paramiko backend with a local SSH server, "ssh-openssh" the ' +
+        'OpenSSH backend with a stand-in "ssh" client)',
+        choices=('nrpe', 'nrpe-plugin', 'ssh', 'ssh-openssh', 'shell'),
+        default='nrpe')
+
+    parser.add_argument('-l', '--latency',
+                        help='Seconds of latency added by the stand-ins',
+                        type=float, default=0.05)
+
+    parser.add_argument('-s', '--soft-ratio',
+                        help='Share of events with a soft state type',
+                        type=float, default=0.7)
+
+    parser.add_argument(
+        '--states', help='Weights of states in the replayed events',
+        default='OK=0.4,WARNING=0.25,CRITICAL=0.3,UNKNOWN=0.05')
+
+    parser.add_argument('--max-attempts',
+                        help='Maximum check attempt of replayed events',
+                        type=int, default=3)
+
+    parser.add_argument('--hosts', help='Number of distinct host names',
+                        type=int, default=200)
+
+    parser.add_argument('--services',
+                        help='Number of distinct service descriptions',
+                        type=int, default=20)
+
+    parser.add_argument('-C', '--checksrc',
+                        help='Detect the check source with the "mon" stand-in',
+                        action='store_true', default=False)
+
+    parser.add_argument(
+        '-a', '--argument', dest='arguments',
+        help='Additional main argument for the event-handler ' +
+        '(can be specified multiple times, like "-a=--perfdata")',
+        action='append', default=[])
+
+    parser.add_argument('--seed', help='Seed for the event generator',
+                        type=int, default=1)
+
+    parser.add_argument('--json', help='Print results as JSON',
+                        action='store_true', default=False)
+
+    parser.add_argument(
+        '--max-startup',
+        help='Exit with status 1 if the median time of spawning the ' +
+        'event-handler for a no-op event exceeds this many milliseconds',
+        type=float)
+
+    parser.add_argument(
+        '--startup-samples',
+        help='Number of no-op events spawned to measure the startup time',
+        type=int, default=20)
+
+    return parser.parse_args()
+
+
+# Generates synthetic events with the configured mix
+def generateevents(args):
+    generator = random.Random(args.seed)
+    weights = []
+
+    for entry in args.states.split(','):
+        state, weight = entry.split('=')
+        weights.append((state.strip(), float(weight)))
+
+    total = sum(weight for state, weight in weights)
+    events = []
+
+    for number in range(args.events):
+        point = generator.uniform(0, total)
+
+        for state, weight in weights:
+            point -= weight
+
+            if point <= 0:
+                break
+
+        soft = generator.random() < args.soft_ratio
+
+        events.append({
+            'name': 'host%04i' % generator.randrange(args.hosts),
+            'description': 'service%03i' % generator.randrange(args.services),
+            'state': state,
+            'state_type': 'SOFT' if soft else 'HARD',
+            'attempt': (generator.randint(1, args.max_attempts - 1)
+                        if soft and args.max_attempts > 1
+                        else args.max_attempts)})
+
+    return events
+
+
+# Builds the event-handler arguments for an event
+def eventargv(args, event, module):
+    argv = [
+        '--host', '127.0.0.1', '--name', event['name'],
+        '--description', event['description'], '--state', event['state'],
+        '--state-type', event['state_type'],
+        '--attempt', str(event['attempt']), '-l', 'none']
+
+    for state in ('ok', 'warning', 'critical', 'unknown'):
+        argv.extend(['--' + state, 'bench_%s' % state])
+
+    if args.checksrc:
+        argv.extend(['--checksrc', '--checksrc-backend', 'mon'])
+
+    return argv + args.arguments + module
+
+
+# Measures the median time of spawning the event-handler for a no-op event
+def startuptime(args):
+    # Soft states without "--soft" are decided by the fast path
+    argv = [
+        sys.executable, script_path, '--host', '127.0.0.1',
+        '--name', 'host0000', '--description', 'service000',
+        '--state', 'CRITICAL', '--state-type', 'SOFT', '--attempt', '1',
+        '-l', 'none', '--critical', 'bench_critical', 'shell']
+
+    durations = []
+
+    for number in range(args.startup_samples):
+        started = time.time()
+        pid = os.spawnv(os.P_NOWAIT, sys.executable, argv)
+        os.waitpid(pid, 0)
+        durations.append(time.time() - started)
+
+    return percentile(sorted(durations), 0.5)
+
+
+# Writes an executable stand-in script
+def standinscript(directory, name, body):
+    path = os.path.join(directory, name)
+
+    with open(path, 'w') as script:
+        script.write('#!/bin/sh\n' + body)
+
+    os.chmod(path, 0755)
+
+    return path
+
+
+# Serves NRPE queries with a fixed latency
+def nrpeserver(latency):
+    from notss_eh.core import readexact
+    from notss_eh.modules.nrpe import nrpepacket
+
+    class NRPEHandler(SocketServer.BaseRequestHandler):
+        def handle(self):
+            try:
+                header = readexact(self.request, 10)
+                version = struct.unpack('!h', header[:2])[0]
+
+                if version == 2:
+                    buffer = readexact(self.request, 1026)
+
+                else:
+                    extra = readexact(self.request, 6)
+                    buffer = readexact(
+                        self.request, struct.unpack('!hi', extra)[1])
+
+                command = buffer.split('\0', 1)[0]
+                time.sleep(latency)
+
+                self.request.sendall(nrpepacket(
+                    version, 2, 0, 'OK - executed "%s"' % command))
+
+            except socket.error:
+                pass
+
+    server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), NRPEHandler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+# Serves SSH sessions, running commands locally with a fixed latency
+def sshserver(latency, environment):
+    import subprocess
+    import paramiko
+
+    hostkey = paramiko.RSAKey.generate(2048)
+
+    class SSHServer(paramiko.ServerInterface):
+        def get_allowed_auths(self, username):
+            return 'password'
+
+        def check_auth_password(self, username, password):
+            return paramiko.AUTH_SUCCESSFUL
+
+        def check_channel_request(self, kind, chanid):
+            if kind == 'session':
+                return paramiko.OPEN_SUCCEEDED
+
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+        def check_channel_exec_request(self, channel, command):
+            thread = threading.Thread(
+                target=self.execute, args=(channel, command))
+
+            thread.daemon = True
+            thread.start()
+
+            return True
+
+        def execute(self, channel, command):
+            time.sleep(latency)
+
+            process = subprocess.Popen(
+                command, shell=True, env=environment,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            stdout, stderr = process.communicate()
+
+            channel.sendall(stdout)
+            channel.sendall_stderr(stderr)
+            channel.send_exit_status(process.returncode)
+            channel.close()
+
+    class SSHHandler(SocketServer.BaseRequestHandler):
+        def handle(self):
+            transport = paramiko.Transport(self.request)
+            transport.add_server_key(hostkey)
+
+            try:
+                transport.start_server(server=SSHServer())
+
+                # Channels are served until the client disconnects
+                while transport.is_active():
+                    time.sleep(0.1)
+
+            except (paramiko.SSHException, EOFError, socket.error):
+                pass
+
+            finally:
+                transport.close()
+
+    server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), SSHHandler)
+    server.daemon_threads = True
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+# Starts the stand-ins and returns module arguments and environment
+def standins(args, directory):
+    environment = dict(os.environ)
+    servers = []
+
+    # Reports this host as check source for every service
+    environment['NOTSS_EH_MON'] = standinscript(
+        directory, 'mon', 'sleep %s\necho "Core Worker 4711"\n' % args.latency)
+
+    if args.module == 'nrpe':
+        server = nrpeserver(args.latency)
+        servers.append(server)
+
+        module = ['nrpe', '--insecure',
+                  '--port', str(server.server_address[1])]
+
+    elif args.module == 'nrpe-plugin':
+        plugin = standinscript(
+            directory, 'check_nrpe',
+            'sleep %s\necho "OK - executed $*"\n' % args.latency)
+
+        module = ['nrpe', '--insecure', '--backend', 'plugin',
+                  '--nrpe-plugin', plugin]
+
+    elif args.module == 'ssh':
+        server = sshserver(args.latency, environment)
+        servers.append(server)
+
+        module = ['ssh', '--user', 'bench', '--password', 'bench',
+                  '--insecure', '--port', str(server.server_address[1])]
+
+    elif args.module == 'ssh-openssh':
+        # Runs the remote command locally instead of connecting
+        ssh = standinscript(
+            directory, 'ssh',
+            'while [ $# -gt 0 ] && [ "$1" != "--" ]; do shift; done\n' +
+            'shift\nsleep %s\nexec /bin/sh -c "$*"\n' % args.latency)
+
+        module = ['ssh', '--user', 'bench', '--private-key', ssh,
+                  '--insecure', '--backend', 'openssh', '--ssh-binary', ssh,
+                  '--control-dir', os.path.join(directory, 'control')]
+
+    else:
+        module = ['shell']
+
+    # Actions are resolved by the stand-ins or run by the shell
+    if args.module in ('shell', 'ssh', 'ssh-openssh'):
+        for state in ('ok', 'warning', 'critical', 'unknown'):
+            standinscript(directory, 'bench_%s' % state,
+                          'sleep %s\necho "%s"\n' % (args.latency, state))
+
+        environment['PATH'] = directory + os.pathsep + environment['PATH']
+
+    return module, environment, servers
+
+
+# Runs handlers for events with a pool of workers and collects measurements
+def replay(args, events, handle):
+    pending = Queue.Queue()
+    results = []
+
+    for event in events:
+        pending.put(event)
+
+    def worker():
+        while True:
+            try:
+                event = pending.get_nowait()
+
+            except Queue.Empty:
+                return
+
+            started = time.time()
+            status, cpu, rss = handle(event)
+
+            results.append((time.time() - started, status, cpu, rss))
+
+    workers = []
+    started = time.time()
+
+    for number in range(args.concurrency):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    for thread in workers:
+        thread.join()
+
+    return time.time() - started, results
+
+
+# Spawns the event-handler (or the client) for every event
+def replayspawn(args, events, module, environment, command):
+    def handle(event):
+        pid = os.spawnve(
+            os.P_NOWAIT, sys.executable,
+            [sys.executable, command] + eventargv(args, event, module),
+            environment)
+
+        pid, status, usage = os.wait4(pid, 0)
+
+        return (status >> 8, usage.ru_utime + usage.ru_stime,
+                usage.ru_maxrss)
+
+    return replay(args, events, handle)
+
+
+# Handles events in this process like the daemon does
+def replayinprocess(args, events, module, environment):
+    import notss_eh
+
+    os.environ.update(environment)
+
+    from notss_eh import core
+
+    core.logger = core.logsetup('none', False)
+
+    def handle(event):
+        argv = eventargv(args, event, module)
+
+        if notss_eh.fastpath(argv):
+            return 0, None, None
+
+        try:
+            core.handler(core.aparser(argv))
+
+        except SystemExit as excp:
+            return excp.code or 0, None, None
+
+        return 0, None, None
+
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    duration, results = replay(args, events, handle)
+
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    core.modules.close()
+
+    cpu = (after.ru_utime + after.ru_stime - before.ru_utime -
+           before.ru_stime + children_after.ru_utime +
+           children_after.ru_stime - children.ru_utime - children.ru_stime)
+
+    return duration, results, cpu, after.ru_maxrss
+
+
+# Reads CPU seconds and peak memory usage (KiB) of a process from /proc
+def processusage(pid):
+    with open('/proc/%i/stat' % pid) as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+
+    ticks = os.sysconf(os.sysconf_names['SC_CLK_TCK'])
+    cpu = sum(int(field) for field in fields[11:15]) / float(ticks)
+    rss = 0
+
+    with open('/proc/%i/status' % pid) as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                rss = int(line.split()[1])
+
+    return cpu, rss
+
+
+# Forwards events to a daemon and waits until it has handled all of them
+def replayclient(args, events, module, environment, directory):
+    import subprocess
+
+    environment = dict(environment)
+    environment['NOTSS_EH_SOCKET'] = os.path.join(directory, 'daemon.sock')
+
+    daemon = subprocess.Popen(
+        [sys.executable, script_path, '--daemon', '--socket',
+         environment['NOTSS_EH_SOCKET'], '-l', 'none'], env=environment)
+
+    while not os.path.exists(environment['NOTSS_EH_SOCKET']):
+        time.sleep(0.01)
+
+    try:
+        duration, results = replayspawn(
+            args, events, module, environment, client_path)
+
+        # The daemon is done when it has been idle for a second
+        cpu = None
+
+        while True:
+            time.sleep(1)
+            usage = processusage(daemon.pid)
+
+            if usage[0] == cpu:
+                break
+
+            cpu = usage[0]
+
+        return duration, results, usage
+
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+# Returns a percentile of sorted values
+def percentile(values, share):
+    if not values:
+        return 0
+
+    return values[min(int(round(share * (len(values) - 1))), len(values) - 1)]
+
+
+# Main function
+def main():
+    args = aparser()
+    events = generateevents(args)
+
+    # Measured before the storm to avoid interference from the stand-ins
+    startup = None
+
+    if args.max_startup is not None:
+        startup = startuptime(args)
+
+    directory = tempfile.mkdtemp(prefix='notss-eh-bench-')
+
+    try:
+        module, environment, servers = standins(args, directory)
+        daemon = None
+
+        if args.mode == 'spawn':
+            duration, results = replayspawn(
+                args, events, module, environment, script_path)
+
+            cpu = sum(result[2] for result in results)
+            rss = max(result[3] for result in results)
+
+        elif args.mode == 'client':
+            duration, results, daemon = replayclient(
+                args, events, module, environment, directory)
+
+            cpu = sum(result[2] for result in results) + daemon[0]
+            rss = max(result[3] for result in results)
+
+        else:
+            duration, results, cpu, rss = replayinprocess(
+                args, events, module, environment)
+
+        for server in servers:
+            server.shutdown()
+
+    finally:
+        shutil.rmtree(directory, True)
+
+    latencies = sorted(result[0] for result in results)
+
+    report = {
+        'mode': args.mode, 'module': args.module, 'events': len(results),
+        'failed': len([result for result in results if result[1]]),
+        'duration': duration,
+        'events_per_second': len(results) / duration,
+        'latency_p50_ms': percentile(latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1000,
+        'latency_max_ms': latencies[-1] * 1000,
+        'cpu_per_event_ms': cpu / len(results) * 1000,
+        'peak_rss_mb': rss / 1024.0}
+
+    if daemon:
+        report['daemon_peak_rss_mb'] = daemon[1] / 1024.0
+
+    if startup is not None:
+        report['startup_p50_ms'] = startup * 1000
+
+    if args.json:
+        print json.dumps(report, sort_keys=True)
+
+    else:
+        printreport(args, report)
+
+    # Guards against regressions of the fast path
+    if startup is not None and report['startup_p50_ms'] > args.max_startup:
+        sys.stderr.write(
+            'Startup time of %.1f ms exceeds the maximum of %.1f ms\n'
+            % (report['startup_p50_ms'], args.max_startup))
+
+        exit(1)
+
+
+# Prints benchmark results in a human readable format
+def printreport(args, report):
+    print 'Mode:            %s (%s stand-in, %.3f second(s) latency)' % (
+        args.mode, args.module, args.latency)
+
+    print 'Events:          %i (%i failed) in %.2f second(s)' % (
+        report['events'], report['failed'], report['duration'])
+
+    print 'Throughput:      %.1f events/second' % report['events_per_second']
+
+    print 'Latency:         p50 %.1f ms, p99 %.1f ms, max %.1f ms' % (
+        report['latency_p50_ms'], report['latency_p99_ms'],
+        report['latency_max_ms'])
+
+    print 'CPU per event:   %.2f ms' % report['cpu_per_event_ms']
+
+    print 'Peak RSS:        %.1f MiB' % report['peak_rss_mb']
+
+    if 'daemon_peak_rss_mb' in report:
+        print 'Daemon peak RSS: %.1f MiB' % report['daemon_peak_rss_mb']
+
+    if 'startup_p50_ms' in report:
+        print 'Startup (no-op): p50 %.1f ms' % report['startup_p50_ms']
+
+
+# Runs main if script is being used stand alone
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+'''notss-eh-client - Thin client for the notss-eh daemon.
+
+Forwards the same command line arguments as accepted by "notss-eh.py" to a
+running "notss-eh.py --daemon" over a Unix socket and returns right away.
+Falls back to running "notss-eh.py" directly if the daemon can't be reached.'''
+
+import socket
+import json
+import sys
+import os
+
+# Default location of the daemon socket (shared with "notss-eh.py")
+socket_path = os.environ.get(
+    'NOTSS_EH_SOCKET', '/var/run/notss-eh/notss-eh.sock')
+
+script_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'notss-eh.py')
+
+
+# Main function
+def main():
+    argv = sys.argv[1:]
+
+    try:
+        event = json.dumps(argv)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(5)
+        client.connect(socket_path)
+        client.sendall(event)
+        client.close()
+
+    except (socket.error, UnicodeDecodeError):
+        # Runs the event-handler directly to avoid losing the event - also
+        # used for arguments that are not valid UTF-8 and can't be forwarded
+        os.execv(sys.executable, [sys.executable, script_path] + argv)
+
+    exit(0)
+
+
+# Runs main if script is being used stand alone
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+'''notss-eh - A not so simple eventhandler for Nagios.
+
+Supports executing "actions" like NRPE commands - hopefully more in the future.
+Built and tested for use on RHEL 6 with op5 Monitor 7.0.2'''
+
+# Only cheap modules may be imported here - this is loaded for every event
+import sys
+
+prog = 'notss-eh'
+version = '0.9.2'
+
+# Main arguments known by the fast path, separated by if they take a value
+fast_values = (
+    '-H', '--host', '-n', '--name', '-d', '--description',
+    '-s', '--state', '-t', '--state-type', '-a', '--attempt',
+    '-o', '--ok', '-w', '--warning', '-c', '--critical', '-u', '--unknown',
+    '-A', '--attempt-exec', '-W', '--wait', '-P', '--parallel', '--spool',
+    '--state-file', '--min-interval', '--max-runs', '--window',
+    '--max-backoff', '--coalesce-dir', '--coalesce-window', '--limit-dir',
+    '--limit-global', '--limit-host', '--limit-deadline', '--targets',
+    '--targets-file', '--fanout', '--target-timeout', '--deadline',
+    '--deadline-minimum', '--checksrc-backend', '--livestatus',
+    '--checksrc-cache', '--checksrc-ttl', '--peers', '--node', '--peer-state',
+    '--rules', '--rules-cache', '--module-dir', '--statsd', '--statsd-prefix',
+    '-l', '--logging', '--log-format', '--log-queue', '--log-overflow',
+    '--retry-attempts', '--retry-delay', '--retry-max-delay',
+    '--retry-status', '--retry-pattern', '--retry-policy', '--cache-file',
+    '--cache-ttl', '--cache-size')
+
+fast_flags = ('-S', '--soft', '-C', '--checksrc', '--backoff', '--perfdata')
+
+fast_aliases = {
+    '-s': '--state', '-t': '--state-type', '-a': '--attempt',
+    '-o': '--ok', '-w': '--warning', '-c': '--critical', '-u': '--unknown',
+    '-A': '--attempt-exec', '-S': '--soft', '-l': '--logging',
+    '-H': '--host', '-n': '--name', '-d': '--description'}
+
+
+# Decides if actions should be executed for the state change
+def actiondecision(state, state_type, attempt, soft, attempt_exec):
+    if soft:
+        return True, ('Adding "%s" actions to execution list ' % state +
+                      'since soft state execution is enabled')
+
+    elif attempt_exec and attempt_exec == attempt:
+        return True, ('Adding "%s" actions to execution list ' % state +
+                      'since check attempt matches attempt execution number')
+
+    elif attempt_exec and attempt_exec != attempt:
+        return False, ('Adding no actions to execution list since check ' +
+                       'attempt did not match check attempt execution number')
+
+    elif state_type == 'HARD':
+        return True, ('Adding "%s" actions to execution list ' % state +
+                      'since the state is hard')
+
+    else:
+        return False, ('Adding no actions to execution ' +
+                       'list since the state change was soft')
+
+
+# Checks if the event is a no-op without loading the event-handler
+def fastpath(argv):
+    values = {}
+    actions = {}
+    index = 0
+
+    while index < len(argv):
+        argument = argv[index]
+        index += 1
+
+        # The first positional argument is the execution module
+        if not argument.startswith('-'):
+            break
+
+        value = None
+
+        if argument.startswith('--') and '=' in argument:
+            argument, value = argument.split('=', 1)
+
+        if argument in fast_flags and value is None:
+            values[fast_aliases.get(argument, argument)] = True
+
+            continue
+
+        # Anything unknown is handled by the complete argument parser
+        if argument not in fast_values:
+            return None
+
+        if value is None:
+            if index == len(argv):
+                return None
+
+            value = argv[index]
+            index += 1
+
+        argument = fast_aliases.get(argument, argument)
+
+        if argument in ('--ok', '--warning', '--critical', '--unknown'):
+            actions.setdefault(argument, []).append(value)
+
+        else:
+            values[argument] = value
+
+    else:
+        return None
+
+    try:
+        state = values['--state']
+        state_type = values['--state-type']
+        attempt = int(values['--attempt'])
+        attempt_exec = int(values.get('--attempt-exec') or 0)
+
+    except (KeyError, ValueError):
+        return None
+
+    required = ('--host', '--name', '--description')
+
+    if '--soft' in values and '--attempt-exec' in values:
+        return None
+
+    if (state not in ('OK', 'WARNING', 'CRITICAL', 'UNKNOWN') or
+            state_type not in ('SOFT', 'HARD') or
+            any(name not in values for name in required) or
+            values.get('--logging', 'stream') not in (
+                'stream', 'syslog', 'none') or
+            values.get('--log-format', 'text') not in ('text', 'json')):
+        return None
+
+    soft = values.get('--soft')
+
+    # Actions of a matching rule replace the actions provided as arguments
+    if '--rules' in values:
+        try:
+            from notss_eh import rules
+
+            rule = rules.lookup(
+                values['--rules'], values.get('--rules-cache'),
+                values['--name'], values['--description'])
+
+        except Exception:
+            return None
+
+        if rule:
+            actions = dict(
+                ('--' + name, rule[name]) for name in
+                ('ok', 'warning', 'critical', 'unknown') if name in rule)
+
+            if 'soft' in rule or 'attempt_exec' in rule:
+                soft = rule.get('soft', False)
+                attempt_exec = rule.get('attempt_exec') or 0
+
+    execute, message = actiondecision(
+        state, state_type, attempt, soft, attempt_exec)
+
+    if execute:
+        state_actions = actions.get('--' + state.lower())
+
+        if state_actions and state_actions[0].lower() != 'skip':
+            return None
+
+        message = 'No actions for state "%s" has been provided' % state
+
+    if values.get('--log-format') == 'json':
+        import json
+        import time
+
+        message = json.dumps({
+            'time': round(time.time(), 6), 'level': 'INFO',
+            'host': values['--name'].decode('utf-8', 'replace'),
+            'service': values['--description'].decode('utf-8', 'replace'),
+            'message': message.decode('utf-8', 'replace')},
+            separators=(',', ':'))
+
+    return values.get('--logging', 'stream'), message
+
+
+# Logs the outcome of the fast path without setting up logging
+def fastlog(destination, message):
+    # Messages in JSON format are logged as is
+    if not message.startswith('{'):
+        message = 'INFO - %s' % message
+
+    if destination == 'stream':
+        sys.stderr.write('notss-eh: %s\n' % message)
+
+    elif destination == 'syslog':
+        import syslog
+
+        syslog.openlog('notss-eh', 0, syslog.LOG_USER)
+        syslog.syslog(syslog.LOG_INFO, message)
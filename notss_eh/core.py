@@ -0,0 +1,3249 @@
+'''notss-eh - Implementation of the event-handler.
+
+Loaded by "notss-eh.py" when an event may result in executed actions.'''
+
+try:
+    import contextlib
+    import argparse
+    import collections
+    import binascii
+    import logging
+    import datetime
+    import getpass
+    import hashlib
+    import threading
+    import signal
+    import select
+    import socket
+    import struct
+    import errno
+    import fcntl
+    import mmap
+    import re
+    import json
+    import time
+    import sys
+    import os
+
+    from notss_eh import actiondecision, modules, rules, version
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+logger = logging.getLogger('notss-eh')
+
+# Layout of the shared state table used for flap suppression
+statetable_slot = struct.Struct('!16sddII')
+statetable_slots = 4096
+statetable_probes = 16
+
+# Context and timing spans of the event handled by the current thread
+eventlocal = threading.local()
+
+# Location of the "mon" command and seconds to wait for it
+mon_path = os.environ.get('NOTSS_EH_MON', '/usr/bin/mon')
+mon_timeout = 30
+
+# Default seconds left before the deadline needed to start an action
+deadline_minimum = 1
+
+# Action durations are logged by default in structured (JSON) logs only
+log_action_timings = False
+
+# Location of the event-handler script (used as askpass program for "ssh")
+script_path = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'notss-eh.py')
+
+# Arguments of spooled events not preventing them from being grouped
+spool_event_fields = (
+    'description', 'state', 'state_type', 'attempt', 'ok', 'warning',
+    'critical', 'unknown')
+
+# Default location of the daemon socket (shared with "notss-eh-client.py")
+socket_path = os.environ.get(
+    'NOTSS_EH_SOCKET', '/var/run/notss-eh/notss-eh.sock')
+
+
+# Parses command line arguments
+def aparser(argv=None):
+    parser = argparse.ArgumentParser(
+        description=sys.modules['notss_eh'].__doc__,
+        epilog='Written by Joel Rangsmo <joel@rangsmo.se>',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    # Common phrases in help text
+    skip = '(use "skip" keyword to ignore action)'
+
+    # Main arguments
+    parser.add_argument(
+        '-H', '--host', help='Specify host address', required=True)
+
+    parser.add_argument(
+        '-n', '--name', help='Specify host name', required=True)
+
+    parser.add_argument('-d', '--description',
+                        help='Specify service description', required=True)
+
+    parser.add_argument('-s', '--state', help='Current state',
+                        choices=('OK', 'WARNING', 'CRITICAL', 'UNKNOWN'),
+                        required=True)
+
+    parser.add_argument('-t', '--state-type', help='State type',
+                        choices=('SOFT', 'HARD'), required=True)
+
+    parser.add_argument('-a', '--attempt',
+                        help='Specify check attempt',
+                        type=int, required=True)
+
+    parser.add_argument(
+        '-o', '--ok', help='Action(s) executing on OK',
+        action='append')
+
+    parser.add_argument(
+        '-w', '--warning', help='Action(s) executing on WARNING %s' % skip,
+        action='append')
+
+    parser.add_argument(
+        '-c', '--critical', help='Action(s) executing on CRITICAL %s' % skip,
+        action='append')
+
+    parser.add_argument(
+        '-u', '--unknown', help='Action(s) executing on UNKNOWN %s' % skip,
+        action='append')
+
+    softexec = parser.add_mutually_exclusive_group()
+
+    softexec.add_argument('-S', '--soft',
+                          help='Execute action(s) on soft state changes',
+                          action='store_true', default=False)
+
+    softexec.add_argument('-A', '--attempt-exec',
+                          help='Execute action(s) on specified check attempt',
+                          type=int)
+
+    parser.add_argument(
+        '-W', '--wait',
+        help='Specifies seconds to sleep between execution of actions)',
+        type=int)
+
+    parser.add_argument(
+        '-P', '--parallel',
+        help='Execute up to N actions concurrently (use "barrier" keyword ' +
+        'action to separate actions that must run in order)',
+        type=int)
+
+    parser.add_argument(
+        '--spool',
+        help='Write event to spool directory for execution by a drain ' +
+        'worker ("notss-eh.py --drain DIR") instead of executing actions')
+
+    parser.add_argument(
+        '--state-file',
+        help='Shared state file used to suppress actions for flapping ' +
+        'services (enables flap suppression)')
+
+    parser.add_argument(
+        '--min-interval',
+        help='Minimum seconds between executions for the same service',
+        type=int, default=0)
+
+    parser.add_argument(
+        '--max-runs',
+        help='Maximum number of executions for the same service per window',
+        type=int)
+
+    parser.add_argument(
+        '--window',
+        help='Length of the flap suppression window in seconds',
+        type=int, default=3600)
+
+    parser.add_argument(
+        '--backoff',
+        help='Double the minimum interval for every repeated execution ' +
+        'within the window',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '--max-backoff',
+        help='Maximum seconds between executions with backoff enabled',
+        type=int, default=3600)
+
+    parser.add_argument(
+        '--coalesce-dir',
+        help='Directory used to share results of identical actions on the ' +
+        'same target between handlers (enables action coalescing)')
+
+    parser.add_argument(
+        '--coalesce-window',
+        help='Seconds after the start of an action during which other ' +
+        'handlers use its result instead of executing it again',
+        type=int, default=30)
+
+    parser.add_argument(
+        '--limit-dir',
+        help='Directory for execution slot lock files shared between ' +
+        'handlers (enables concurrency limits)')
+
+    parser.add_argument(
+        '--limit-global',
+        help='Maximum number of handlers executing actions concurrently',
+        type=int)
+
+    parser.add_argument(
+        '--limit-host',
+        help='Maximum number of handlers executing actions concurrently ' +
+        'on the same target host',
+        type=int)
+
+    parser.add_argument(
+        '--limit-deadline',
+        help='Seconds to wait for an execution slot before giving up',
+        type=int, default=60)
+
+    parser.add_argument(
+        '--targets',
+        help='Comma separated list of target hosts to execute actions on ' +
+        '(overrides the host address of the execution module)')
+
+    parser.add_argument(
+        '--targets-file',
+        help='File listing target hosts to execute actions on, one per line')
+
+    parser.add_argument(
+        '--fanout',
+        help='Maximum number of targets executing actions concurrently',
+        type=int, default=10)
+
+    parser.add_argument(
+        '--target-timeout',
+        help='Seconds before execution on a single target is abandoned',
+        type=int, default=60)
+
+    parser.add_argument(
+        '--deadline',
+        help='Seconds the event-handler may run before it is killed by ' +
+        'the monitoring core (shared by check source detection and all ' +
+        'actions, which are skipped or cancelled if they can not finish ' +
+        'in time)',
+        type=float)
+
+    parser.add_argument(
+        '--deadline-minimum',
+        help='Seconds that must be left before the deadline to start an ' +
+        'action or a "--wait" sleep',
+        type=float, default=deadline_minimum)
+
+    parser.add_argument(
+        '--retry-attempts',
+        help='Maximum number of attempts of failed actions',
+        type=int, default=1)
+
+    parser.add_argument(
+        '--retry-delay',
+        help='Seconds before the second attempt of a failed action ' +
+        '(doubled for every further attempt, with random jitter)',
+        type=float, default=1)
+
+    parser.add_argument(
+        '--retry-max-delay',
+        help='Maximum seconds between attempts of a failed action',
+        type=float, default=30)
+
+    parser.add_argument(
+        '--retry-status',
+        help='Status code of successful actions (the execution module ' +
+        'decides if not specified)',
+        type=int)
+
+    parser.add_argument(
+        '--retry-pattern',
+        help='Regular expression matching the output of successful actions')
+
+    parser.add_argument(
+        '--retry-policy',
+        help='Retry policy for actions matching a pattern, as a JSON ' +
+        'object like \'{"action": "restart_*", "attempts": 3, "delay": 2, ' +
+        '"max_delay": 10, "status": 0, "pattern": "started"}\' ' +
+        '(can be specified multiple times, first match is used)',
+        type=policyargument, action='append')
+
+    parser.add_argument(
+        '--cache-file',
+        help='File caching results of actions shared between handlers ' +
+        '(enables the result cache for actions given with "--cache-ttl")')
+
+    parser.add_argument(
+        '--cache-ttl',
+        help='Seconds to reuse results of actions matching a pattern, ' +
+        'like "ensure_*=60" (can be specified multiple times, first ' +
+        'match is used)',
+        type=cacheargument, action='append')
+
+    parser.add_argument(
+        '--cache-size',
+        help='Maximum size of the cache file in bytes (least recently ' +
+        'used results are evicted)',
+        type=int, default=1048576)
+
+    parser.add_argument(
+        '-C', '--checksrc',
+        help='Enables a hack to determine if this host  is the check source ' +
+        'for the service (Can be usefull in peered setups)',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '--checksrc-backend',
+        help='Query check source from Livestatus socket or "mon" command ' +
+        'or calculate it locally from the peer list with "hash"',
+        choices=('livestatus', 'mon', 'hash'), default='livestatus')
+
+    parser.add_argument(
+        '--livestatus', help='Location of Livestatus socket',
+        default='/opt/monitor/var/rw/live')
+
+    parser.add_argument(
+        '--checksrc-cache',
+        help='Directory for caching check source results')
+
+    parser.add_argument(
+        '--checksrc-ttl',
+        help='Seconds to cache check source results',
+        type=int, default=60)
+
+    parser.add_argument(
+        '--peers',
+        help='Comma separated list of all peer node names ' +
+        '(used with the "hash" check source backend)')
+
+    parser.add_argument(
+        '--node', help='Name of this node in the peer list',
+        default=socket.gethostname())
+
+    parser.add_argument(
+        '--peer-state',
+        help='File listing peer node names that are down, one per line')
+
+    parser.add_argument(
+        '--statsd',
+        help='Send phase timings as StatsD metrics to "HOST[:PORT]" (UDP)')
+
+    parser.add_argument(
+        '--statsd-prefix', help='Prefix of StatsD metric names',
+        default='notss_eh')
+
+    parser.add_argument(
+        '--perfdata',
+        help='Log a summary of phase timings in Nagios performance data ' +
+        'format when the event has been handled',
+        action='store_true', default=False)
+
+    # General settings
+    parser.add_argument('-l', '--logging', help='Set logging destination',
+                        choices=('stream', 'syslog', 'none'),
+                        default='stream')
+
+    parser.add_argument('-V', '--verbose', help='Enable verbose logging',
+                        action='store_true', default=False)
+
+    logarguments(parser)
+
+    parser.add_argument('-v', '--version', help='Display program version',
+                        action='version', version=version)
+
+    parser.add_argument('--funk', help=argparse.SUPPRESS,
+                        action='store_true', default=False)
+
+    parser.add_argument(
+        '--rules',
+        help='Rules file mapping host and service patterns to actions ' +
+        'and execution modules (replaces the action arguments and ' +
+        'execution module for matching services)')
+
+    parser.add_argument(
+        '--rules-cache',
+        help='Location of the compiled rules index ' +
+        '(the rules file location with an ".idx" suffix if not specified)')
+
+    parser.add_argument(
+        '--module-dir',
+        help='Directory with execution module plugins ("<module>.py")')
+
+    # Execution module and its arguments (parsed by the selected module)
+    parser.add_argument(
+        'execmod', metavar='module',
+        help='Specifies action execution module (built-in: %s)'
+        % ', '.join(name for name, description in modules.builtin))
+
+    parser.add_argument('mod_args', nargs=argparse.REMAINDER,
+                        help='Arguments for the execution module ' +
+                        '(use "<module> --help" for details)')
+
+    args = parser.parse_args(argv)
+
+    moduleargs(args, args.mod_args, parser.prog, parser.error)
+
+    del args.mod_args
+
+    return args
+
+
+# Parses and checks a retry policy argument
+def policyargument(value):
+    try:
+        return rules.checkpolicy(rules.utf8(json.loads(value)))
+
+    except ValueError as emsg:
+        raise argparse.ArgumentTypeError('invalid retry policy: %s' % emsg)
+
+
+# Parses a cache TTL argument
+def cacheargument(value):
+    pattern, separator, ttl = value.rpartition('=')
+
+    try:
+        return rules.checkcache({'action': pattern or '*', 'ttl': float(ttl)})
+
+    except ValueError as emsg:
+        raise argparse.ArgumentTypeError('invalid cache TTL: %s' % emsg)
+
+
+# Parses the arguments of the selected execution module into the namespace
+def moduleargs(args, argv, prog, error):
+    # Only the selected execution module is imported
+    try:
+        module = modules.load(args.execmod, args.module_dir)
+
+    except Exception as emsg:
+        error('failed to load execution module "%s": %s'
+              % (args.execmod, emsg))
+
+    if not module:
+        error('unknown execution module "%s" (choose from %s)'
+              % (args.execmod, ', '.join(modules.available(args.module_dir))))
+
+    mod_parser = argparse.ArgumentParser(
+        prog='%s %s' % (prog, args.execmod),
+        description=module.__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    module.arguments(mod_parser)
+    mod_parser.parse_args(argv, namespace=args)
+
+
+# Parses command line arguments for daemon mode
+def daemonparser():
+    parser = argparse.ArgumentParser(
+        description='Runs notss-eh as a persistent daemon, listening for ' +
+        'events from "notss-eh-client.py" on a Unix socket',
+        epilog='Written by Joel Rangsmo <joel@rangsmo.se>',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--daemon', help='Enable daemon mode',
+                        action='store_true', required=True)
+
+    parser.add_argument('-U', '--socket', help='Path to listening Unix socket',
+                        default=socket_path)
+
+    parser.add_argument('-M', '--socket-mode',
+                        help='Permissions for listening socket (octal)',
+                        default='0660')
+
+    parser.add_argument('-w', '--workers',
+                        help='Number of events handled concurrently',
+                        type=int, default=16)
+
+    parser.add_argument('-l', '--logging', help='Set logging destination',
+                        choices=('stream', 'syslog', 'none'),
+                        default='stream')
+
+    parser.add_argument('-V', '--verbose', help='Enable verbose logging',
+                        action='store_true', default=False)
+
+    logarguments(parser)
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.workers < 1:
+        parser.error('The number of workers must be at least 1')
+
+    return args
+
+
+# Parses command line arguments for spool drain mode
+def drainparser():
+    parser = argparse.ArgumentParser(
+        description='Executes events written to a spool directory by ' +
+        'notss-eh with the "--spool" argument',
+        epilog='Written by Joel Rangsmo <joel@rangsmo.se>',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--drain', help='Spool directory to drain',
+                        required=True)
+
+    parser.add_argument('-b', '--batch-size',
+                        help='Maximum number of events processed per batch',
+                        type=int, default=100)
+
+    parser.add_argument('-i', '--interval',
+                        help='Seconds to sleep when the spool is empty ' +
+                        '(drains once and exits if not specified)',
+                        type=float)
+
+    parser.add_argument('-w', '--workers',
+                        help='Number of event groups executed concurrently',
+                        type=int, default=4)
+
+    parser.add_argument('-l', '--logging', help='Set logging destination',
+                        choices=('stream', 'syslog', 'none'),
+                        default='stream')
+
+    parser.add_argument('-V', '--verbose', help='Enable verbose logging',
+                        action='store_true', default=False)
+
+    logarguments(parser)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+# Parses command line arguments for log tail mode
+def tailparser():
+    parser = argparse.ArgumentParser(
+        description='Handles events parsed from "SERVICE ALERT" and ' +
+        '"HOST ALERT" lines appended to the log file of the monitoring core',
+        epilog='Written by Joel Rangsmo <joel@rangsmo.se>',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--tail', help='Log file of the monitoring core',
+                        required=True)
+
+    parser.add_argument(
+        '-k', '--checkpoint',
+        help='File recording the log file offset of handled events',
+        default='/var/lib/notss-eh/tail.checkpoint')
+
+    parser.add_argument(
+        '-F', '--from-start',
+        help='Read the log file from the beginning if there is no ' +
+        'checkpoint (only new lines are read otherwise)',
+        action='store_true', default=False)
+
+    parser.add_argument('-b', '--batch-size',
+                        help='Maximum number of log lines read per batch',
+                        type=int, default=1000)
+
+    parser.add_argument('-i', '--interval',
+                        help='Seconds to sleep when no new lines are found',
+                        type=float, default=1)
+
+    parser.add_argument(
+        '-w', '--workers',
+        help='Number of host/service pairs handled concurrently',
+        type=int, default=4)
+
+    parser.add_argument(
+        '--host-description',
+        help='Service description used for events of host checks',
+        default='_HOST_')
+
+    parser.add_argument('-l', '--logging', help='Set logging destination',
+                        choices=('stream', 'syslog', 'none'),
+                        default='stream')
+
+    parser.add_argument('-V', '--verbose', help='Enable verbose logging',
+                        action='store_true', default=False)
+
+    logarguments(parser)
+
+    parser.add_argument(
+        'event', nargs=argparse.REMAINDER,
+        help='Arguments used to handle every parsed event - main ' +
+        'arguments except the host, name, description, state, state type ' +
+        'and attempt, followed by the execution module and its arguments')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.event[:1] == ['--']:
+        del args.event[0]
+
+    if not args.event:
+        parser.error('Arguments for handling events must be specified')
+
+    return args
+
+
+# Adds arguments for log format and queueing to a parser
+def logarguments(parser):
+    parser.add_argument('--log-format', help='Set log message format',
+                        choices=('text', 'json'), default='text')
+
+    parser.add_argument(
+        '--log-queue',
+        help='Ship log messages from a queue of this size in a background ' +
+        'thread (0 writes log messages directly)',
+        type=int, default=0)
+
+    parser.add_argument(
+        '--log-overflow',
+        help='Drop new log messages or wait for space if the log queue ' +
+        'is full', choices=('drop', 'block'), default='drop')
+
+
+# Configures application logging
+def logsetup(destination, verbose, logformat='text', queue=0,
+             overflow='drop'):
+
+    global log_action_timings
+
+    logger = logging.getLogger('notss-eh')
+    formatter = logging.Formatter(
+        'notss-eh: %(levelname)s - %(message)s')
+
+    log_action_timings = logformat == 'json'
+
+    if logformat == 'json' or queue:
+        from notss_eh import logs
+
+    if logformat == 'json':
+        formatter = logs.JSONFormatter(
+            'notss-eh: ' if destination == 'syslog' else '')
+
+        logger.addFilter(logs.EventFilter(eventlocal))
+
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+
+    else:
+        logger.setLevel(logging.INFO)
+
+    if destination == 'stream':
+        loghandler = logging.StreamHandler()
+
+    elif destination == 'syslog':
+        from logging.handlers import SysLogHandler
+
+        loghandler = SysLogHandler(address='/dev/log')
+
+    elif destination == 'none':
+        loghandler = logging.NullHandler()
+
+    loghandler.setFormatter(formatter)
+
+    # Slow log destinations don't block event handling with a queue
+    if queue:
+        loghandler = logs.QueueHandler(loghandler, queue, overflow)
+
+    logger.addHandler(loghandler)
+
+    return logger
+
+
+# Non important function to generate data output
+def nothingtoseehere():
+    import random
+
+    print '''
+                      |
+                      |            .'
+                  \   |   /
+               `.  .d88b.   .'
+                  d888888b
+      --     --  (88888888)  --
+                  Y888888Y
+              .'   `Y88Y'   `.
+                  /
+           .'         !        `.
+
+
+       .,,-~&,               ,~"~.
+      { /___/\`.             > ::::
+     { `}'~.~/\ \   ` `     <, ?::;
+     {`}'\._/  ) }   ) )     l_  f
+      ,__/ l_,'-/  .'.'    ,__}--{_.
+     {  `.__.' (          /         }
+      \ \    )  )        /          !
+       \-\`-'`-'        /  ,    1  J;
+  ` `   \ \___l,-_,___.'  /1    !  Y
+   ) )   k____-~'-l_____.' |    l /
+ .'.'   /===#==\           l     f
+      .'        `.         I===I=I
+    ,' ,'       `.`.       f     }
+  ,' ,'  /      \ `.`.     |     }
+.'^.^.^.'`.'`.^.'`.'`.^.   l    Y;
+           `.   \          }    |
+            !`,  \         |    |
+            l /   }       ,1    |
+            l/   /        !l   ,l
+            /  ,'         ! \    \\
+'''
+
+    if datetime.date.today().weekday() == 4:
+        tunes = [
+            {'titel': 'Bruce Hornsby & the Range - The Way It Is',
+             'url': 'http://youtu.be/4-k2JCV4TCs'},
+            {'titel': '2 Unlimited - No Limit',
+             'url': 'http://youtu.be/RkEXGgdqMz8'}]
+
+    else:
+        tunes = [
+            {'titel': 'Kool & The Gang - Get Down On It ',
+             'url': 'http://youtu.be/qchPLaiKocI'},
+            {'titel': 'Chic - Everybody Dance',
+             'url': 'http://youtu.be/J1MMzMGX8xY'},
+            {'titel': 'Boney M - Rasputin',
+             'url': 'http://youtu.be/9_T3x8qBoic'},
+            {'titel': 'Jamiroquai - Cosmic Girl',
+             'url': 'http://youtu.be/D-NvQ6VJYtE'}]
+
+    tune = tunes[random.randrange(0, len(tunes))]
+
+    print ('Millitaa [SC]haniqua calls for party time, fellas!' +
+           '\n%s - %s' % (tune['titel'], tune['url']))
+
+
+# Hack to check if this host is the check source for the object
+def checksrc(name, description, backend, livestatus, cachedir, ttl,
+             peers, node, peerstate):
+    logger.info(
+        'Trying to determine check source for host "%s" and service "%s"'
+        % (name, description))
+
+    # Hash based ownership is cheaper to calculate than a cache lookup
+    if backend == 'hash':
+        return checksrc_hash(peers, node, peerstate, name, description)
+
+    if cachedir and ttl:
+        source = checksrc_cache(cachedir, ttl, name, description)
+
+        if source is not None:
+            logger.info('Using cached check source result (%s)'
+                        % ('local' if source else 'remote'))
+
+            return source
+
+    if backend == 'livestatus':
+        source = checksrc_livestatus(livestatus, name, description)
+
+    else:
+        source = checksrc_mon(name, description)
+
+    # Failed lookups are not cached
+    if source is None:
+        return False
+
+    if cachedir and ttl:
+        checksrc_cache(cachedir, ttl, name, description, source)
+
+    return source
+
+
+# Decides ownership of the object locally with rendezvous hashing
+def checksrc_hash(peers, node, peerstate, name, description):
+    peers = [peer.strip() for peer in (peers or '').split(',') if peer.strip()]
+
+    if node not in peers:
+        logger.error('Local node "%s" is not included in peer list "%s"'
+                     % (node, ','.join(peers)))
+
+        return False
+
+    # Peers listed in the state file are considered down
+    down = set()
+
+    if peerstate:
+        try:
+            with open(peerstate) as state:
+                for line in state:
+                    line = line.split('#', 1)[0].strip()
+
+                    if line:
+                        down.add(line)
+
+        except IOError as emsg:
+            logger.debug('Could not read peer state file: "%s"' % emsg)
+
+    available = [peer for peer in peers if peer == node or peer not in down]
+
+    if len(available) < len(peers):
+        logger.info('Excluding down peer(s) "%s" from ownership calculation'
+                    % ','.join(sorted(set(peers) - set(available))))
+
+    owner = max(available, key=lambda peer: hashlib.md5(
+        '%s\0%s\0%s' % (peer, name, description)).digest())
+
+    if owner == node:
+        logger.info('This host was found as the check source')
+
+        return True
+
+    logger.info('This host was not found to be the check source ' +
+                '(owned by peer "%s")' % owner)
+
+    return False
+
+
+# Reads or stores a cached check source result
+def checksrc_cache(cachedir, ttl, name, description, source=None):
+    cachefile = os.path.join(
+        cachedir, 'checksrc-%s' % hashlib.md5(
+            '%s\0%s' % (name, description)).hexdigest())
+
+    if source is not None:
+        logger.debug('Caching check source result in "%s"' % cachefile)
+
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+
+            temporary = '%s.%i' % (cachefile, os.getpid())
+
+            with open(temporary, 'w') as cache:
+                cache.write('1' if source else '0')
+
+            os.rename(temporary, cachefile)
+
+        except (IOError, OSError) as emsg:
+            logger.debug('Failed to cache check source result: "%s"' % emsg)
+
+        return source
+
+    try:
+        if time.time() - os.stat(cachefile).st_mtime > ttl:
+            return None
+
+        with open(cachefile) as cache:
+            return cache.read() == '1'
+
+    except (IOError, OSError):
+        return None
+
+
+# Checks the check source by querying the Livestatus socket directly
+def checksrc_livestatus(livestatus, name, description):
+    name = name.replace('\n', '')
+    description = description.replace('\n', '')
+
+    # Fetches check source of both service and host with a single query
+    query = (
+        'GET services\n' +
+        'Columns: check_source host_check_source\n' +
+        'Filter: host_name = %s\n' % name +
+        'Filter: description = %s\n' % description +
+        'OutputFormat: json\n' +
+        'ResponseHeader: fixed16\n\n')
+
+    logger.debug('Querying Livestatus socket "%s" for check source:\n\n%s'
+                 % (livestatus, query))
+
+    try:
+        rows = livestatusquery(livestatus, query)
+
+        if not rows:
+            logger.info('Could not find source for service "%s"'
+                        % description)
+
+            rows = [[''] + row for row in livestatusquery(
+                livestatus,
+                'GET hosts\n' +
+                'Columns: check_source\n' +
+                'Filter: name = %s\n' % name +
+                'OutputFormat: json\n' +
+                'ResponseHeader: fixed16\n\n')]
+
+    except (socket.error, ValueError) as emsg:
+        logger.error('Failed to query Livestatus: "%s"' % emsg)
+
+        return None
+
+    logger.debug('Livestatus response: "%s"' % rows)
+
+    if not rows:
+        logger.info('Could not find source for host "%s"' % name)
+
+        return False
+
+    service_source, host_source = rows[0]
+
+    if not service_source:
+        logger.info('Using check source of host "%s"' % name)
+
+        service_source = host_source
+
+    if 'Core Worker' in service_source:
+        logger.info('This host was found as the check source')
+
+        return True
+
+    logger.info('This host was not found to be the check source')
+
+    return False
+
+
+# Reads an exact number of bytes from a connection
+def readexact(connection, length):
+    data = []
+
+    while length:
+        chunk = connection.recv(length)
+
+        if not chunk:
+            raise socket.error('Connection closed by remote host')
+
+        data.append(chunk)
+        length -= len(chunk)
+
+    return ''.join(data)
+
+
+# Sends a query to a Livestatus socket and returns decoded rows
+def livestatusquery(livestatus, query):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timelimit(10))
+
+    try:
+        connection.connect(livestatus)
+        connection.sendall(query)
+        connection.shutdown(socket.SHUT_WR)
+
+        status, length = readexact(connection, 16).split(None, 1)
+        response = readexact(connection, int(length))
+
+    finally:
+        connection.close()
+
+    if status != '200':
+        raise ValueError('Livestatus returned status %s: %s'
+                         % (status, response.strip()))
+
+    return json.loads(response)
+
+
+# Checks the check source with the "mon" command
+def checksrc_mon(name, description):
+    monpath = mon_path
+
+    logger.debug(
+        'Executing the following mon command to determine the check source: ' +
+        '%s query ls services -c check_source host_name ' % monpath +
+        '-e "%s" description -e "%s"' % (name, description))
+
+    returncode, source, timedout = runcommand(
+        '%s query ls services -c check_source ' % monpath +
+        'host_name -e "%s" description -e "%s"' % (name, description),
+        '/bin/sh', timelimit(mon_timeout), 65536)
+
+    if returncode != 0:
+        logger.error('Failed to run "mon" command!')
+        logger.debug('Communicate: \n\n"%s" -\n\nReturn code: "%i"'
+                     % (str(source), returncode))
+
+        return None
+
+    elif 'Core Worker' in source[0]:
+        logger.info('This host was found as the check source')
+
+        return True
+
+    elif not source[0].replace('\n', ''):
+        logger.info('Could not find source for service "%s"' % description)
+        logger.debug('Communicate: \n\n"%s"' % str(source))
+
+    else:
+        logger.info('This host was not found to be the check source')
+        logger.debug('Communicate: \n\n"%s"' % str(source))
+
+        return False
+
+    logger.info('Looking for check source for host "%s"' % name)
+
+    logger.debug(
+        'Executing the following mon command to determine the check source: ' +
+        '%s query ls hosts -c check_source name -e "%s"'
+        % (monpath, name))
+
+    returncode, source, timedout = runcommand(
+        '%s query ls hosts -c check_source name -e "%s"'
+        % (monpath, name), '/bin/sh', timelimit(mon_timeout), 65536)
+
+    if returncode != 0:
+        logger.error('Failed to run "mon" command!')
+        logger.debug('Communicate: \n\n"%s" -\n\nReturn code: "%i"'
+                     % (str(source), returncode))
+
+        return None
+
+    elif 'Core Worker' in source[0]:
+        logger.info('This host was found as the check source')
+
+        return True
+
+    elif not source[0].replace('\n', ''):
+        logger.info('Could not find source for host "%s"' % name)
+        logger.debug('Communicate: \n\n"%s"' % str(source))
+
+        return False
+
+    else:
+        logger.info('This host was not found to be the check source')
+        logger.debug('Communicate: \n\n"%s"' % str(source))
+
+        return False
+
+
+# Checks which, if any, actions should be executed
+def execactions(state, state_type, attempt, soft, attempt_exec):
+    logger.info('Checking if any actions should be added to execution list')
+
+    execute, message = actiondecision(
+        state, state_type, attempt, soft, attempt_exec)
+
+    logger.info(message)
+
+    if not execute:
+        return False
+
+    return state
+
+
+# Runs a command with a timeout and bounded output capture
+def runcommand(command, shell, timeout, limit, environment=None):
+    import subprocess
+
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        stdin=open(os.devnull), shell=True, executable=shell,
+        close_fds=True, preexec_fn=os.setsid, env=environment)
+
+    # Only the last "limit" bytes of each stream are kept
+    descriptors = (process.stdout.fileno(), process.stderr.fileno())
+    buffers = {}
+
+    for descriptor in descriptors:
+        buffers[descriptor] = [collections.deque(), 0, 0]
+
+    pending = list(descriptors)
+    expires = timeout and time.time() + timeout
+    timedout = False
+
+    while pending or process.poll() is None:
+        remaining = expires and expires - time.time()
+
+        if expires and remaining <= 0:
+            timedout = True
+            killgroup(process)
+
+            break
+
+        if not pending:
+            time.sleep(min(0.01, remaining or 0.01))
+
+            continue
+
+        try:
+            readable = select.select(pending, [], [], remaining or None)[0]
+
+        except select.error as emsg:
+            if emsg.args[0] == errno.EINTR:
+                continue
+
+            raise
+
+        for descriptor in readable:
+            chunk = os.read(descriptor, 65536)
+
+            if not chunk:
+                pending.remove(descriptor)
+
+                continue
+
+            chunks, size, dropped = buffers[descriptor]
+            chunks.append(chunk)
+            size += len(chunk)
+
+            while size > limit:
+                excess = size - limit
+
+                if len(chunks[0]) <= excess:
+                    excess = len(chunks.popleft())
+
+                else:
+                    chunks[0] = chunks[0][excess:]
+
+                size -= excess
+                dropped += excess
+
+            buffers[descriptor] = [chunks, size, dropped]
+
+    process.stdout.close()
+    process.stderr.close()
+
+    output = []
+
+    for descriptor in descriptors:
+        chunks, size, dropped = buffers[descriptor]
+        data = ''.join(chunks)
+
+        if dropped:
+            data = '[... %i bytes truncated ...]\n' % dropped + data
+
+        output.append(data)
+
+    return process.returncode, tuple(output), timedout
+
+
+# Terminates the process group of a command, killing it if necessary
+def killgroup(process):
+    for signum, grace in ((signal.SIGTERM, 2), (signal.SIGKILL, 0)):
+        try:
+            os.killpg(process.pid, signum)
+
+        except OSError:
+            pass
+
+        expires = time.time() + grace
+
+        while process.poll() is None and time.time() < expires:
+            time.sleep(0.01)
+
+    process.wait()
+
+
+# Splits actions into stages separated by the "barrier" keyword
+def actionstages(actions, barriers=True):
+    # Without concurrent execution "barrier" is a normal action
+    if not barriers:
+        return [list(actions)] if actions else []
+
+    stages = [[]]
+
+    for action in actions:
+        if action.lower() == 'barrier':
+            stages.append([])
+
+            continue
+
+        stages[-1].append(action)
+
+    return [stage for stage in stages if stage]
+
+
+# Executes actions in a bounded pool of worker threads
+def runparallel(execute, actions, parallel):
+    import Queue
+
+    results = [None] * len(actions)
+    pending = Queue.Queue()
+    context = dict(vars(eventlocal))
+
+    for index, action in enumerate(actions):
+        pending.put((index, action))
+
+    def worker():
+        vars(eventlocal).update(context)
+
+        while True:
+            try:
+                index, action = pending.get_nowait()
+
+            except Queue.Empty:
+                return
+
+            try:
+                results[index] = (True, execute(action))
+
+            except Exception as excp:
+                results[index] = (False, excp)
+
+    workers = []
+
+    for number in range(min(parallel, len(actions))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+
+    for thread in workers:
+        thread.join()
+
+    return results
+
+
+# Shares results of identical actions started by other handlers
+def coalesced(execute, directory, window, target, outcome=None):
+    def execute_coalesced(action):
+        arrival = time.time()
+        filename = os.path.join(directory, 'coalesce-%s' % hashlib.md5(
+            '%s\0%s' % (target, action)).hexdigest())
+
+        # Shared results contain action output - only the owner may read them
+        try:
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory, 0700)
+
+                except OSError as emsg:
+                    if emsg.errno != errno.EEXIST:
+                        raise
+
+            descriptor = os.open(filename, os.O_RDWR | os.O_CREAT, 0600)
+
+        except OSError as emsg:
+            logger.error('Failed to open coalescing file "%s": "%s"'
+                         % (filename, emsg))
+
+            return execute(action)
+
+        # The lock is held by the handler currently executing the action
+        try:
+            if not lockwait(descriptor, action):
+                logger.error('Deadline reached while waiting for identical ' +
+                             'action "%s" - executing it without coalescing'
+                             % action)
+
+                return execute(action)
+
+            try:
+                shared = json.loads(os.read(descriptor, 1048576) or 'null')
+
+            except ValueError:
+                shared = None
+
+            if shared and 0 <= arrival - shared['started'] <= window:
+                logger.info(
+                    'Using shared result of action "%s" started ' % action +
+                    '%.1f second(s) ago by another handler'
+                    % (arrival - shared['started']))
+
+                return rules.utf8(shared['result'])
+
+            started = time.time()
+            result = execute(action)
+
+            # Failed actions are executed again by the next handler
+            if outcome is not None and not outcome(result)[0]:
+                return result
+
+            try:
+                data = json.dumps({'started': started, 'result': result})
+
+            except UnicodeDecodeError:
+                logger.debug('Not sharing result of action "%s" since its '
+                             % action + 'output is not valid UTF-8')
+
+                return result
+
+            os.ftruncate(descriptor, 0)
+            os.lseek(descriptor, 0, os.SEEK_SET)
+            os.write(descriptor, data)
+
+            return result
+
+        finally:
+            os.close(descriptor)
+
+    return execute_coalesced
+
+
+# Locks a coalescing file, waiting no longer than the current action may run
+def lockwait(descriptor, action):
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        return True
+
+    except IOError:
+        logger.info('Waiting for identical action "%s" ' % action +
+                    'executing in another handler')
+
+    limit = timelimit(None)
+
+    if limit is None:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+
+        return True
+
+    expires = time.time() + limit
+
+    while time.time() < expires:
+        time.sleep(0.05)
+
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            return True
+
+        except IOError:
+            continue
+
+    return False
+
+
+# Builds a shell script running all actions with delimited output
+def batchscript(actions, wait):
+    marker = 'NOTSS-EH-%s' % binascii.hexlify(os.urandom(8))
+    script = []
+
+    for number, action in enumerate(actions):
+        if wait and number:
+            script.append('sleep %i' % wait)
+
+        script.extend([
+            "printf '\\n%%s\\n' '%s begin %i'" % (marker, number),
+            "printf '\\n%%s\\n' '%s begin %i' >&2" % (marker, number),
+            '(', action, ') </dev/null',
+            'status=$?',
+            "printf '\\n%%s %%s\\n' '%s end %i' $status" % (marker, number),
+            "printf '\\n%%s\\n' '%s end %i' >&2" % (marker, number)])
+
+    return marker, '\n'.join(script) + '\n'
+
+
+# Splits the output of a batch script into per action results
+def batchsplit(marker, count, stdout, stderr):
+    stdouts = dict(
+        (int(number), (output, int(status))) for number, output, status in
+        re.findall(r'\n%s begin (\d+)\n(.*?)\n%s end \1 (\d+)\n'
+                   % (marker, marker), '\n' + stdout, re.S))
+
+    stderrs = dict(
+        (int(number), output) for number, output in
+        re.findall(r'\n%s begin (\d+)\n(.*?)\n%s end \1\n'
+                   % (marker, marker), '\n' + stderr, re.S))
+
+    # Actions without an end marker did not finish or lost their output
+    results = []
+
+    for number in range(count):
+        output, status = stdouts.get(number, ('', None))
+        results.append((status, output, stderrs.get(number, '')))
+
+    return results
+
+
+# Records the execution time of every action
+def timedaction(execute):
+    def execute_timed(action):
+        with timed('action', action):
+            return execute(action)
+
+    return execute_timed
+
+
+# Builds the retry policies of an event from its arguments
+def retrypolicies(args):
+    default = {
+        'action': '*', 'attempts': getattr(args, 'retry_attempts', 1),
+        'delay': getattr(args, 'retry_delay', 1),
+        'max_delay': getattr(args, 'retry_max_delay', 30),
+        'status': getattr(args, 'retry_status', None),
+        'pattern': getattr(args, 'retry_pattern', None)}
+
+    policies = []
+
+    # Policies only override the keys they specify
+    for policy in getattr(args, 'retry_policy', None) or ():
+        merged = dict(default)
+        merged.update(policy)
+        policies.append(merged)
+
+    return policies + [default]
+
+
+# Returns the retry policy of an action of the current event
+def retrypolicy(action):
+    import fnmatch
+
+    for policy in getattr(eventlocal, 'retry', None) or ():
+        if fnmatch.fnmatchcase(action, policy['action']):
+            return policy
+
+    return None
+
+
+# Checks if the result of an action is successful according to its policy
+def retrysuccess(policy, outcome, result):
+    successful, status, output = outcome(result)
+
+    if policy['status'] is None and not policy['pattern']:
+        return successful
+
+    if policy['status'] is not None and status != policy['status']:
+        return False
+
+    if policy['pattern'] and not re.search(policy['pattern'], output or ''):
+        return False
+
+    return True
+
+
+# Sleeps before the next attempt unless it can't finish before the deadline
+def retrywait(subject, policy, attempt):
+    import random
+
+    delay = min(policy['delay'] * 2 ** (attempt - 1), policy['max_delay'])
+    pause = random.uniform(delay / 2.0, delay)
+    expires = getattr(eventlocal, 'expires', None)
+
+    if expires and time.time() + pause + minimumleft() > expires:
+        logger.error('Not retrying %s since its share of the deadline '
+                     % subject + 'would be exceeded')
+
+        return False
+
+    logger.info('Retrying %s in %.1f second(s) (attempt %i of %i)'
+                % (subject, pause, attempt + 1, policy['attempts']))
+
+    with timed('retry'):
+        time.sleep(pause)
+
+    return True
+
+
+# Executes failed actions again with backoff until they succeed
+def retried(execute, outcome):
+    def execute_retried(action):
+        policy = retrypolicy(action)
+        result = execute(action)
+        attempt = 1
+
+        if not policy or policy['attempts'] < 2:
+            return result
+
+        while not retrysuccess(policy, outcome, result):
+            if attempt >= policy['attempts']:
+                logger.error('Action "%s" failed after %i attempt(s)'
+                             % (action, attempt))
+
+                return result
+
+            if not retrywait('action "%s"' % action, policy, attempt):
+                return result
+
+            attempt += 1
+            result = execute(action)
+
+        if attempt > 1:
+            logger.info('Action "%s" succeeded on attempt %i'
+                        % (action, attempt))
+
+        return result
+
+    return execute_retried
+
+
+# Executes failed actions of a batch again with backoff in smaller batches
+def retriedbatch(batch, actions, results, outcome):
+    policies = [retrypolicy(action) for action in actions]
+    attempt = 1
+
+    while True:
+        failed = [index for index, policy in enumerate(policies)
+                  if policy and policy['attempts'] > 1 and
+                  not retrysuccess(policy, outcome, results[index])]
+
+        pending = [index for index in failed
+                   if policies[index]['attempts'] > attempt]
+
+        # The policy with the longest backoff decides when to retry
+        policy = pending and max(
+            [policies[index] for index in pending],
+            key=lambda policy: min(policy['delay'] * 2 ** (attempt - 1),
+                                   policy['max_delay']))
+
+        if not pending or not retrywait(
+                '%i failed action(s) of the batch' % len(pending),
+                policy, attempt):
+
+            for index in failed:
+                logger.error('Action "%s" failed after %i attempt(s)'
+                             % (actions[index], min(
+                                 attempt, policies[index]['attempts'])))
+
+            return results
+
+        attempt += 1
+
+        for index, result in zip(pending, batch(
+                [actions[index] for index in pending])):
+
+            results[index] = result
+
+
+# Builds the result cache settings of an event from its arguments
+def cachesettings(args):
+    if not getattr(args, 'cache_file', None):
+        return None
+
+    return {'file': args.cache_file, 'size': args.cache_size,
+            'ttls': args.cache_ttl or []}
+
+
+# Returns the seconds to cache the result of an action of the current event
+def cachettl(action):
+    import fnmatch
+
+    cache = getattr(eventlocal, 'cache', None)
+
+    for policy in cache and cache['ttls'] or ():
+        if fnmatch.fnmatchcase(action, policy.get('action', '*')):
+            return policy['ttl']
+
+    return None
+
+
+# Looks up or stores results in the cache file shared between handlers
+def cacheaccess(cache, keys, store=None):
+    try:
+        descriptor = os.open(cache['file'], os.O_RDWR | os.O_CREAT, 0600)
+
+    except OSError as emsg:
+        logger.error('Failed to open cache file "%s": "%s"'
+                     % (cache['file'], emsg))
+
+        return {}
+
+    found = {}
+
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+
+        try:
+            entries = json.loads(os.read(
+                descriptor, os.fstat(descriptor).st_size) or '{}')
+
+        except ValueError:
+            entries = {}
+
+        now = time.time()
+        changed = bool(store)
+
+        for key, entry in entries.items():
+            if entry['expires'] <= now:
+                del entries[key]
+                changed = True
+
+        for key in keys:
+            if key in entries:
+                entries[key]['used'] = now
+                found[key] = (rules.utf8(entries[key]['result']),
+                              now - entries[key]['stored'])
+
+                changed = True
+
+        for key, (result, ttl) in (store or {}).items():
+
+            # Results which can't be stored as JSON (not UTF-8) aren't cached
+            try:
+                json.dumps(result)
+
+            except UnicodeDecodeError:
+                logger.debug('Not caching result which is not valid UTF-8')
+
+                continue
+
+            entries[key] = {'stored': now, 'used': now,
+                            'expires': now + ttl, 'result': result}
+
+        if not changed:
+            return found
+
+        # Evicts the least recently used results until the cache fits
+        data = json.dumps(entries, separators=(',', ':'))
+
+        if len(data) > cache['size']:
+            excess = len(data) - cache['size']
+
+            for used, key in sorted(
+                    (entry['used'], key) for key, entry in entries.items()):
+
+                if excess <= 0:
+                    break
+
+                excess -= len(json.dumps(
+                    {key: entries.pop(key)}, separators=(',', ':')))
+
+            data = json.dumps(entries, separators=(',', ':'))
+
+        os.ftruncate(descriptor, 0)
+        os.lseek(descriptor, 0, os.SEEK_SET)
+        os.write(descriptor, data)
+
+    except (IOError, OSError, KeyError, TypeError,
+            UnicodeDecodeError) as emsg:
+        logger.error('Failed to use cache file "%s": "%s"'
+                     % (cache['file'], emsg))
+
+    finally:
+        os.close(descriptor)
+
+    return found
+
+
+# Checks if the result of an action may be cached
+def cacheable(action, outcome, result):
+    if outcome is None:
+        return False
+
+    # Modules without a return code to match report every result as
+    # successful, so a retry status or pattern or a zero status is required
+    policy = retrypolicy(action)
+
+    if policy and (policy['status'] is not None or policy['pattern']):
+        return retrysuccess(policy, outcome, result)
+
+    successful, status, output = outcome(result)
+
+    return successful and status == 0
+
+
+# Returns the cache key of an action on a target
+def cachekey(target, action):
+    return hashlib.md5('%s\0%s' % (target, action)).hexdigest()
+
+
+# Reuses cached results of actions on the same target
+def cached(execute, target, outcome):
+    cache = eventlocal.cache
+
+    def execute_cached(action):
+        ttl = cachettl(action)
+
+        if not ttl:
+            return execute(action)
+
+        key = cachekey(target, action)
+        found = cacheaccess(cache, [key])
+
+        if key in found:
+            result, age = found[key]
+
+            logger.info('Using cached result of action "%s" from %.1f '
+                        % (action, age) + 'second(s) ago')
+
+            return result
+
+        result = execute(action)
+
+        # Failed actions are executed again by the next handler
+        if cacheable(action, outcome, result):
+            cacheaccess(cache, [], {key: (result, ttl)})
+
+        return result
+
+    return execute_cached
+
+
+# Reuses cached results of actions in a batch, executing only the others
+def cachedbatch(batch, target, outcome):
+    cache = eventlocal.cache
+
+    def batch_cached(actions):
+        ttls = [cachettl(action) for action in actions]
+        keys = [ttl and cachekey(target, action)
+                for action, ttl in zip(actions, ttls)]
+
+        if not any(keys):
+            return batch(actions)
+
+        found = cacheaccess(cache, [key for key in keys if key])
+        results = [None] * len(actions)
+        pending = []
+
+        for index, action in enumerate(actions):
+            if keys[index] in found:
+                result, age = found[keys[index]]
+                results[index] = result
+
+                logger.info('Using cached result of action "%s" from %.1f '
+                            % (action, age) + 'second(s) ago')
+
+            else:
+                pending.append(index)
+
+        if not pending:
+            return results
+
+        store = {}
+
+        for index, result in zip(pending, batch(
+                [actions[index] for index in pending])):
+
+            results[index] = result
+
+            if keys[index] and cacheable(actions[index], outcome, result):
+                store[keys[index]] = (result, ttls[index])
+
+        if store:
+            cacheaccess(cache, [], store)
+
+        return results
+
+    return batch_cached
+
+
+# Executes actions sequentially or in parallel and reports results in order
+def runactions(actions, wait, parallel, execute, report,
+               coalesce=None, target=None, batch=None, outcome=None):
+    stages = actionstages(actions, bool(parallel))
+    deadline = remaining() is not None
+    minimum = minimumleft()
+
+    # Batches run all actions with a single invocation
+    if batch:
+        actions = [action for stage in stages for action in stage]
+
+        if getattr(eventlocal, 'cache', None):
+            batch = cachedbatch(batch, target, outcome)
+
+        if deadline and remaining() < minimum:
+            skipactions(actions, 'the deadline has been reached')
+
+            return False
+
+        logger.info('Executing %i action(s) as a single batch' % len(actions))
+
+        successful = True
+
+        with timed('batch'):
+            results = batch(actions)
+
+            if outcome:
+                results = retriedbatch(batch, actions, results, outcome)
+
+        if deadline:
+            eventlocal.schedule[
+                'timedout' if remaining() <= 0 else 'executed'].extend(actions)
+
+        for action, result in zip(actions, results):
+            successful = report(action, result) and successful
+
+        return successful
+
+    # Retries are completed before results are shared with other handlers
+    if outcome:
+        execute = retried(execute, outcome)
+
+    if coalesce:
+        execute = coalesced(
+            execute, coalesce[0], coalesce[1], target, outcome)
+
+    # Cached results are used without coalescing or executing actions
+    if getattr(eventlocal, 'cache', None):
+        execute = cached(execute, target, outcome)
+
+    execute = timedaction(execute)
+    successful = True
+
+    # Pending actions share the time left before the deadline
+    slot = {'expires': None}
+
+    if deadline:
+        execute = scheduledaction(execute, slot)
+
+    def schedule(pending):
+        left = remaining()
+
+        if left < minimum:
+            return False
+
+        share = (left - (wait or 0) * (pending - 1)) / pending
+
+        slot['expires'] = min(time.time() + max(share, minimum),
+                              eventlocal.deadline)
+
+        return True
+
+    if not parallel:
+        sequence = [action for stage in stages for action in stage]
+
+        for index, action in enumerate(sequence):
+            if wait:
+                if deadline and remaining() - wait < minimum:
+                    skipactions(sequence[index:], 'the deadline would be ' +
+                                'reached while waiting')
+
+                    return False
+
+                logger.debug(
+                    'Waiting %i second(s) before command execution'
+                    % wait)
+
+                with timed('wait'):
+                    time.sleep(wait)
+
+            if deadline and not schedule(len(sequence) - index):
+                skipactions(sequence[index:], 'the deadline has been reached')
+
+                return False
+
+            successful = report(action, execute(action)) and successful
+
+        return successful
+
+    logger.info('Executing actions in %i stage(s) with up to %i workers'
+                % (len(stages), parallel))
+
+    for number, stage in enumerate(stages):
+        if wait and number:
+            if deadline and remaining() - wait < minimum:
+                skipactions(sum(stages[number:], []), 'the deadline would ' +
+                            'be reached while waiting')
+
+                return False
+
+            logger.debug(
+                'Waiting %i second(s) before execution of next stage' % wait)
+
+            with timed('wait'):
+                time.sleep(wait)
+
+        # Actions of a stage run concurrently and share a slot
+        if deadline and not schedule(len(stages) - number):
+            skipactions(sum(stages[number:], []),
+                        'the deadline has been reached')
+
+            return False
+
+        results = runparallel(execute, stage, parallel)
+
+        for action, (success, result) in zip(stage, results):
+            if not success:
+                raise result
+
+            successful = report(action, result) and successful
+
+    return successful
+
+
+# Handles a single event with already parsed arguments
+def handler(args, parsed=0, watchdog=False):
+    eventlocal.timings = []
+    eventlocal.host = args.name
+    eventlocal.service = args.description
+    started = time.time()
+    timer = None
+
+    if parsed:
+        recordtiming('parse', parsed)
+
+    # The deadline is shared by all phases, including argument parsing
+    eventlocal.deadline = args.deadline and started - parsed + args.deadline
+    eventlocal.expires = eventlocal.deadline
+    eventlocal.minimum = args.deadline_minimum
+    eventlocal.schedule = {
+        'executed': [], 'skipped': [], 'timedout': [], 'running': []}
+
+    # Reports and exits before the monitoring core kills the process
+    if watchdog and args.deadline:
+        timer = threading.Timer(
+            max(eventlocal.deadline - time.time(), 0), deadlineexceeded,
+            (args, eventlocal.schedule))
+
+        timer.daemon = True
+        timer.start()
+
+    try:
+        handleevent(args)
+
+    finally:
+        # Daemon threads waiting at interpreter shutdown raise errors
+        if timer:
+            timer.cancel()
+            timer.join()
+
+        recordtiming('total', time.time() - started + parsed)
+        reporttimings(args, eventlocal.timings)
+
+        if args.deadline:
+            reportschedule(eventlocal.schedule, eventlocal.deadline)
+
+
+# Returns the seconds left before the deadline of the current event
+def remaining():
+    deadline = getattr(eventlocal, 'deadline', None)
+
+    if not deadline:
+        return None
+
+    return deadline - time.time()
+
+
+# Returns the seconds left before the deadline needed to start an action
+def minimumleft():
+    return getattr(eventlocal, 'minimum', deadline_minimum)
+
+
+# Limits a timeout to the time left for the current action or phase
+def timelimit(timeout):
+    expires = getattr(eventlocal, 'expires', None)
+
+    if not expires:
+        return timeout
+
+    left = max(expires - time.time(), 0.001)
+
+    # A timeout of zero disables timeouts without a deadline
+    if not timeout:
+        return left
+
+    return min(timeout, left)
+
+
+# Records actions skipped since they can not finish before the deadline
+def skipactions(actions, reason):
+    schedule = getattr(eventlocal, 'schedule', None)
+
+    if schedule is None or not actions:
+        return
+
+    logger.error('Skipping %i action(s) since %s: "%s"'
+                 % (len(actions), reason, '", "'.join(actions)))
+
+    schedule['skipped'].extend(actions)
+
+
+# Executes actions within their share of the time left before the deadline
+def scheduledaction(execute, slot):
+    schedule = eventlocal.schedule
+
+    def execute_scheduled(action):
+        eventlocal.expires = slot['expires']
+        schedule['running'].append(action)
+
+        try:
+            return execute(action)
+
+        finally:
+            schedule['running'].remove(action)
+
+            # Actions still running at the end of their share were cancelled
+            if time.time() >= eventlocal.expires:
+                schedule['timedout'].append(action)
+
+            else:
+                schedule['executed'].append(action)
+
+            eventlocal.expires = eventlocal.deadline
+
+    return execute_scheduled
+
+
+# Logs a summary of executed, skipped and timed out actions
+def reportschedule(schedule, deadline):
+    # Actions still running have been abandoned
+    timedout = schedule['timedout'] + schedule['running']
+
+    logger.info(
+        'Deadline summary - %i executed, %i skipped, %i timed out '
+        % (len(schedule['executed']), len(schedule['skipped']),
+           len(timedout)) +
+        '(%.3f second(s) left)' % max(deadline - time.time(), 0))
+
+    if schedule['skipped']:
+        logger.error('Skipped actions: "%s"'
+                     % '", "'.join(schedule['skipped']))
+
+    if timedout:
+        logger.error('Timed out actions: "%s"' % '", "'.join(timedout))
+
+
+# Exits when the deadline is reached with actions still running
+def deadlineexceeded(args, schedule):
+    logger.error('Deadline of %.1f second(s) was reached - exiting'
+                 % args.deadline)
+
+    reportschedule(schedule, time.time())
+
+    # Queued log records are written before exiting
+    logging.shutdown()
+    os._exit(2)
+
+
+# Measures the duration of a phase of the current event
+@contextlib.contextmanager
+def timed(phase, action=None):
+    started = time.time()
+
+    try:
+        yield
+
+    finally:
+        recordtiming(phase, time.time() - started, action)
+
+
+# Records and logs the duration of a phase of the current event
+def recordtiming(phase, duration, action=None):
+    timings = getattr(eventlocal, 'timings', None)
+
+    if timings is not None:
+        timings.append((phase, duration, action))
+
+    fields = {'phase': phase, 'duration': duration}
+
+    if action is None:
+        logger.debug('Phase "%s" finished in %.3f second(s)'
+                     % (phase, duration), extra=fields)
+
+    else:
+        fields['action'] = action
+
+        # Text logs only get them with "--verbose" to save blocking writes
+        logger.log(logging.INFO if log_action_timings else logging.DEBUG,
+                   'Phase "%s" of action "%s" finished in %.3f second(s)'
+                   % (phase, action, duration), extra=fields)
+
+
+# Sends timing spans of the event as StatsD metrics and performance data
+def reporttimings(args, timings):
+    totals = collections.OrderedDict()
+
+    for phase, duration, action in timings:
+        totals[phase] = totals.get(phase, 0) + duration
+
+    if getattr(args, 'perfdata', False):
+        logger.info(
+            'Handled event in %.3f second(s) | ' % totals.get('total', 0) +
+            ' '.join("'%s'=%.6fs;;;0" % (phase, duration)
+                     for phase, duration in totals.items()))
+
+    if not getattr(args, 'statsd', None):
+        return
+
+    host, port = (args.statsd.rsplit(':', 1) + ['8125'])[:2]
+    metrics = ['%s.events:1|c' % args.statsd_prefix]
+
+    # Every action and wait is sent as a separate sample of its phase timer
+    for phase, duration, action in timings:
+        metrics.append('%s.%s:%.3f|ms'
+                       % (args.statsd_prefix, phase, duration * 1000))
+
+    try:
+        connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        connection.sendto('\n'.join(metrics), (host, int(port)))
+        connection.close()
+
+    except (socket.error, ValueError) as emsg:
+        logger.debug('Failed to send StatsD metrics to "%s": "%s"'
+                     % (args.statsd, emsg))
+
+
+# Handles a single event, recording timings of its phases
+def handleevent(args):
+    logger.debug('Provided arguments: "%s"' % args)
+
+    logger.info(
+        'The event-handler has been started by user "%s"' % getpass.getuser() +
+        ' for host "%s" and service "%s". ' % (args.name, args.description))
+
+    if args.rules:
+        with timed('rules'):
+            applyrules(args)
+
+    # Check source detection is deferred to the drain worker when spooling
+    if not args.spool:
+        with timed('checksrc'):
+            owner = isowner(args)
+
+        if not owner:
+            exit(0)
+
+    with timed('select'):
+        actions = selectactions(args)
+
+    # Suppresses actions for flapping objects
+    if args.state_file:
+        with timed('debounce'):
+            allowed = debounce(
+                args.state_file, args.name, args.description,
+                args.min_interval, args.max_runs, args.window, args.backoff,
+                args.max_backoff)
+
+        if not allowed:
+            exit(0)
+
+    if args.spool:
+        with timed('spool'):
+            spoolevent(args.spool, args, actions)
+
+        return
+
+    # Rules may have replaced the retry policies and cache TTLs
+    eventlocal.retry = retrypolicies(args)
+    eventlocal.cache = cachesettings(args)
+
+    execmodule(args, actions)
+
+
+# Replaces the actions and execution module with a matching rule
+def applyrules(args):
+    try:
+        rule = rules.lookup(
+            args.rules, args.rules_cache, args.name, args.description)
+
+    except (IOError, OSError, ValueError) as emsg:
+        logger.error('Failed to load rules file "%s": "%s"'
+                     % (args.rules, emsg))
+
+        exit(2)
+
+    if not rule:
+        logger.info('No rule matched - using actions provided as arguments')
+
+        return
+
+    logger.info('Using rule %i of rules file "%s"'
+                % (rule['number'], args.rules))
+
+    for state in ('ok', 'warning', 'critical', 'unknown'):
+        setattr(args, state, rule.get(state))
+
+    if 'soft' in rule or 'attempt_exec' in rule:
+        args.soft = rule.get('soft', False)
+        args.attempt_exec = rule.get('attempt_exec')
+
+    if 'retry' in rule:
+        args.retry_policy = rule['retry']
+
+    if 'cache' in rule:
+        args.cache_ttl = rule['cache']
+
+    if 'module' not in rule:
+        return
+
+    # Removes the arguments of the execution module provided as arguments
+    for name in vars(args).keys():
+        if name.startswith('mod_'):
+            delattr(args, name)
+
+    args.execmod = rule['module'][0]
+
+    def error(message):
+        raise ValueError(message)
+
+    try:
+        moduleargs(args, rule['module'][1:], 'rule %i:' % rule['number'],
+                   error)
+
+    except ValueError as emsg:
+        logger.error('Invalid execution module in rule %i of rules file '
+                     % rule['number'] + '"%s": "%s"' % (args.rules, emsg))
+
+        exit(2)
+
+    except SystemExit:
+        logger.error('Invalid execution module arguments in rule %i of '
+                     % rule['number'] + 'rules file "%s"' % args.rules)
+
+        exit(2)
+
+
+# Hack to check if this host is the check source for the service
+def isowner(args):
+    if not args.checksrc:
+        return True
+
+    return checksrc(
+        args.name, args.description, args.checksrc_backend,
+        args.livestatus, args.checksrc_cache, args.checksrc_ttl,
+        args.peers, args.node, args.peer_state)
+
+
+# Returns the actions that should be executed for the event
+def selectactions(args):
+    # Checks if actions should be executed and add them to the "actions" array
+    actions = execactions(args.state, args.state_type,
+                          args.attempt, args.soft, args.attempt_exec)
+
+    if actions == 'OK':
+        actions = args.ok
+
+    elif actions == 'WARNING':
+        actions = args.warning
+
+    elif actions == 'CRITICAL':
+        actions = args.critical
+
+    elif actions == 'UNKNOWN':
+        actions = args.unknown
+
+    else:
+        exit(0)
+
+    if not actions or actions[0].lower() == 'skip':
+        logger.info('No actions for state "%s" has been provided' % args.state)
+        exit(0)
+
+    else:
+        # Barriers only separate stages of parallel execution
+        logger.info('Added %i action(s) to execution list' % len(
+            sum(actionstages(actions, args.parallel), [])))
+
+    logger.debug('Actions for execution: "%s"' % actions)
+
+    return actions
+
+
+# Executes actions on the target host or fans them out to several targets
+def execmodule(args, actions):
+    targets = fanouttargets(args)
+
+    if not targets:
+        return exectarget(args, actions)
+
+    return fanout(args, actions, targets)
+
+
+# Reads the list of targets for fan-out execution
+def fanouttargets(args):
+    targets = []
+
+    if args.targets:
+        targets.extend(args.targets.split(','))
+
+    if args.targets_file:
+        try:
+            with open(args.targets_file) as targetfile:
+                for line in targetfile:
+                    targets.append(line.split('#', 1)[0])
+
+        except IOError as emsg:
+            logger.error('Failed to read targets file "%s": "%s"'
+                         % (args.targets_file, emsg))
+
+            exit(2)
+
+    # Removes empty lines and duplicates while keeping the order
+    unique = []
+
+    for target in targets:
+        target = target.strip()
+
+        if target and target not in unique:
+            unique.append(target)
+
+    return unique
+
+
+# Executes actions concurrently on several targets
+def fanout(args, actions, targets):
+    logger.info('Executing actions on %i target(s) with up to %i '
+                % (len(targets), args.fanout) + 'target(s) concurrently')
+
+    pending = list(targets)
+    running = {}
+    results = {}
+    timedout = []
+    skipped = []
+    abandoned = []
+
+    context = dict(vars(eventlocal))
+
+    def worker(target):
+        vars(eventlocal).update(context)
+
+        # The target timeout is the deadline of actions on the target, so
+        # their processes are killed when it is reached
+        expires = time.time() + args.target_timeout
+        eventlocal.deadline = min(eventlocal.deadline or expires, expires)
+        eventlocal.expires = eventlocal.deadline
+
+        targetargs = argparse.Namespace(**vars(args))
+        targetargs.host = target
+
+        if hasattr(targetargs, 'mod_host'):
+            targetargs.mod_host = None
+
+        try:
+            results[target] = bool(exectarget(targetargs, actions))
+
+        except SystemExit:
+            results[target] = False
+
+        except Exception as emsg:
+            logger.error('Unhandled error while executing actions on ' +
+                         'target "%s": "%s"' % (target, emsg))
+
+            results[target] = False
+
+    while pending or running:
+        # Targets that can not finish before the deadline are not started
+        left = remaining()
+
+        if pending and left is not None and left < minimumleft():
+            for target in pending:
+                skipactions(sum(actionstages(actions, args.parallel), []),
+                            'the deadline was reached before target ' +
+                            '"%s" was started' % target)
+
+            skipped.extend(pending)
+            del pending[:]
+
+        while pending and len(running) < args.fanout:
+            target = pending.pop(0)
+
+            thread = threading.Thread(target=worker, args=(target,))
+            thread.daemon = True
+            thread.start()
+
+            running[target] = (thread, time.time())
+
+        for target, (thread, started) in running.items():
+            if not thread.is_alive():
+                del running[target]
+
+            # Stuck targets are abandoned and reported as timed out
+            elif time.time() - started > args.target_timeout or (
+                    left is not None and left <= 0):
+                logger.error('Execution on target "%s" timed out after '
+                             % target + '%i second(s)'
+                             % (time.time() - started))
+
+                timedout.append(target)
+                abandoned.append(thread)
+                del running[target]
+
+        time.sleep(0.01)
+
+    # Gives cancelled actions of timed out targets a moment to be cleaned up
+    grace = time.time() + 1
+
+    for thread in abandoned:
+        thread.join(max(grace - time.time(), 0))
+
+    succeeded = [target for target in targets
+                 if target not in timedout and results.get(target)]
+
+    failed = [target for target in targets if target not in timedout and
+              target not in skipped and not results.get(target)]
+
+    logger.info('Fan-out finished - %i succeeded, %i failed, %i timed out'
+                % (len(succeeded), len(failed), len(timedout)) +
+                (', %i skipped' % len(skipped) if skipped else ''))
+
+    if failed:
+        logger.error('Failed targets: "%s"' % '", "'.join(failed))
+
+    if timedout:
+        logger.error('Timed out targets: "%s"' % '", "'.join(timedout))
+
+    return not failed and not timedout and not skipped
+
+
+# Executes actions within the configured concurrency limits
+def exectarget(args, actions):
+    slots = []
+
+    if args.limit_dir:
+        patience = timelimit(args.limit_deadline)
+
+        with timed('slots'):
+            slots = acquireslots(
+                args.limit_dir, getattr(args, 'mod_host', None) or args.host,
+                args.limit_global, args.limit_host, patience)
+
+        if slots is None:
+            logger.error('Gave up waiting for an execution slot after ' +
+                         '%i second(s)' % patience)
+
+            skipactions(sum(actionstages(actions, args.parallel), []),
+                        'no execution slot was acquired')
+
+            exit(2)
+
+    try:
+        with timed('module'):
+            return routemodule(args, actions)
+
+    finally:
+        for descriptor in slots:
+            os.close(descriptor)
+
+
+# Waits in line for a global and a per target host execution slot
+def acquireslots(directory, host, global_limit, host_limit, deadline):
+    hostkey = hashlib.md5(host).hexdigest()[:16]
+    queue = os.path.join(directory, 'queue')
+    ticket = '%.6f-%i-%s' % (time.time(), os.getpid(), hostkey)
+
+    try:
+        if not os.path.isdir(queue):
+            os.makedirs(queue)
+
+        open(os.path.join(queue, ticket), 'w').close()
+
+    except (IOError, OSError) as emsg:
+        logger.error('Failed to create execution slot ticket: "%s"' % emsg)
+
+        return []
+
+    expires = time.time() + deadline
+    waiting = False
+
+    try:
+        while True:
+            earlier = []
+
+            for entry in sorted(os.listdir(queue)):
+                if entry == ticket:
+                    break
+
+                # Removes tickets left behind by dead handlers
+                try:
+                    os.kill(int(entry.split('-')[1]), 0)
+
+                except OSError as emsg:
+                    if emsg.errno == errno.ESRCH:
+                        try:
+                            os.unlink(os.path.join(queue, entry))
+
+                        except OSError:
+                            pass
+
+                        continue
+
+                except (IndexError, ValueError):
+                    continue
+
+                earlier.append(entry)
+
+            # Handlers are served in order per target host and globally
+            eligible = not [entry for entry in earlier
+                            if entry.endswith('-' + hostkey)]
+
+            if global_limit and len(earlier) >= global_limit:
+                eligible = False
+
+            if eligible:
+                slots = []
+
+                for name, limit in (('host-%s' % hostkey, host_limit),
+                                    ('global', global_limit)):
+                    if not limit:
+                        continue
+
+                    descriptor = lockslot(directory, name, limit)
+
+                    if descriptor is None:
+                        break
+
+                    slots.append(descriptor)
+
+                else:
+                    if waiting:
+                        logger.info('Acquired execution slot for host "%s"'
+                                    % host)
+
+                    return slots
+
+                for descriptor in slots:
+                    os.close(descriptor)
+
+            if time.time() > expires:
+                return None
+
+            if not waiting:
+                logger.info('Waiting for execution slot for host "%s"' % host)
+                waiting = True
+
+            time.sleep(0.05)
+
+    finally:
+        os.unlink(os.path.join(queue, ticket))
+
+
+# Tries to lock one of the slot files for a limit
+def lockslot(directory, name, limit):
+    for number in range(limit):
+        descriptor = os.open(
+            os.path.join(directory, '%s-%i' % (name, number)),
+            os.O_RDWR | os.O_CREAT, 0644)
+
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except IOError:
+            os.close(descriptor)
+
+            continue
+
+        return descriptor
+
+    return None
+
+
+# "Router" for execution module selection
+def routemodule(args, actions):
+    coalesce = None
+
+    if args.coalesce_dir:
+        coalesce = (args.coalesce_dir, args.coalesce_window)
+
+    try:
+        module = modules.load(args.execmod, getattr(args, 'module_dir', None))
+
+    except Exception as emsg:
+        logger.error('Failed to load execution module "%s": "%s"'
+                     % (args.execmod, emsg))
+        exit(2)
+
+    if not module:
+        logger.error('Could not find execution module for "%s"' % args.execmod)
+        exit(2)
+
+    return module.execute(args, actions, coalesce)
+
+
+# Checks and records action executions in the shared state table
+def debounce(statefile, name, description, min_interval,
+             max_runs, window, backoff, max_backoff):
+    key = hashlib.md5('%s\0%s' % (name, description)).digest()
+    size = statetable_slots * statetable_slot.size
+
+    try:
+        descriptor = os.open(statefile, os.O_RDWR | os.O_CREAT, 0644)
+
+    except OSError as emsg:
+        logger.error('Failed to open state file "%s": "%s"'
+                     % (statefile, emsg))
+
+        return True
+
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+
+        if os.fstat(descriptor).st_size < size:
+            os.ftruncate(descriptor, size)
+
+        table = mmap.mmap(descriptor, size)
+
+        # Finds the slot of the object with linear probing
+        first = struct.unpack('!I', key[:4])[0] % statetable_slots
+        candidates = []
+
+        for probe in range(statetable_probes):
+            offset = ((first + probe) % statetable_slots) * \
+                statetable_slot.size
+
+            slot = statetable_slot.unpack_from(table, offset)
+
+            if slot[0] == key or slot[0] == '\0' * 16:
+                break
+
+            candidates.append((slot[1], offset))
+
+        # Replaces the least recently executed object if no slot is free
+        else:
+            offset = min(candidates)[1]
+            slot = statetable_slot.unpack_from(table, offset)
+
+        now = time.time()
+
+        if slot[0] == key:
+            slotkey, last, window_start, runs, streak = slot
+
+        else:
+            last, window_start, runs, streak = 0.0, now, 0, 0
+
+        if now - window_start > window:
+            window_start, runs = now, 0
+
+        interval = min_interval or 0
+
+        if backoff and streak and now - last < window:
+            interval = min(interval * 2 ** (streak - 1), max_backoff)
+
+        if last and now - last < interval:
+            logger.info(
+                'Suppressing actions since they were executed %i ' %
+                (now - last) + 'second(s) ago (minimum interval is %i)'
+                % interval)
+
+            allowed = False
+
+        elif max_runs and runs >= max_runs:
+            logger.info(
+                'Suppressing actions since they have been executed ' +
+                '%i time(s) in the last %i second(s)' % (runs, window))
+
+            allowed = False
+
+        else:
+            allowed = True
+            streak = streak + 1 if last and now - last < window else 1
+
+            statetable_slot.pack_into(
+                table, offset, key, now, window_start, runs + 1, streak)
+
+        table.close()
+
+    except (IOError, OSError, mmap.error) as emsg:
+        logger.error('Failed to use state file "%s": "%s"'
+                     % (statefile, emsg))
+
+        return True
+
+    finally:
+        os.close(descriptor)
+
+    return allowed
+
+
+# Atomically writes an event record to the spool directory
+def spoolevent(spool, args, actions):
+    record = dict(vars(args))
+    record['spool'] = None
+    record['actions'] = actions
+
+    filename = '%.6f-%i-%s' % (
+        time.time(), os.getpid(), binascii.hexlify(os.urandom(4)))
+
+    temporary = os.path.join(spool, 'tmp', filename)
+
+    # Records contain module options like passwords - only the owner may
+    # read them
+    try:
+        for subdir in ('tmp', 'new', 'cur'):
+            if not os.path.isdir(os.path.join(spool, subdir)):
+                os.makedirs(os.path.join(spool, subdir), 0700)
+
+        descriptor = os.open(
+            temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+
+        with os.fdopen(descriptor, 'w') as event:
+            json.dump(record, event, separators=(',', ':'))
+
+        os.rename(temporary, os.path.join(spool, 'new', filename))
+
+    except (IOError, OSError) as emsg:
+        logger.error('Failed to write event to spool directory "%s": "%s"'
+                     % (spool, emsg))
+
+        exit(2)
+
+    logger.info('Spooled %i action(s) as event "%s"'
+                % (len(actions), filename))
+
+
+# Claims a batch of event records from the spool directory
+def claimevents(spool, batch):
+    claimed = []
+
+    try:
+        filenames = sorted(os.listdir(os.path.join(spool, 'new')))
+
+    except OSError as emsg:
+        logger.error('Failed to read spool directory "%s": "%s"'
+                     % (spool, emsg))
+
+        return claimed
+
+    for filename in filenames[:batch]:
+        current = os.path.join(spool, 'cur', filename)
+
+        # Claimed records stay locked until executed, so records in "cur"
+        # that are not locked were abandoned by a crashed drain worker
+        try:
+            event = open(os.path.join(spool, 'new', filename))
+
+        except IOError:
+            continue
+
+        try:
+            fcntl.flock(event, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            # Renaming fails if another drain worker claimed the record first
+            os.rename(os.path.join(spool, 'new', filename), current)
+
+        except (IOError, OSError):
+            event.close()
+
+            continue
+
+        try:
+            claimed.append((current, event, rules.utf8(json.load(event))))
+
+        except ValueError as emsg:
+            logger.error('Failed to read spooled event "%s": "%s"'
+                         % (filename, emsg))
+
+            releaseevents([(current, event)], True)
+
+    return claimed
+
+
+# Releases claimed event records, removing them if they were processed
+def releaseevents(events, processed):
+    for filename, event in events:
+        if processed:
+            os.unlink(filename)
+
+        event.close()
+
+
+# Moves event records abandoned by crashed drain workers back to the queue
+def recoverevents(spool):
+    for filename in sorted(os.listdir(os.path.join(spool, 'cur'))):
+        current = os.path.join(spool, 'cur', filename)
+
+        try:
+            with open(current) as event:
+                fcntl.flock(event, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.rename(current, os.path.join(spool, 'new', filename))
+
+        except (IOError, OSError):
+            continue
+
+        logger.info('Recovered abandoned spooled event "%s"' % filename)
+
+
+# Executes a group of spooled events sharing module and target host
+def draingroup(group):
+    eventargs, actions = group
+    eventlocal.timings = []
+    eventlocal.host = eventargs.name
+    eventlocal.service = None
+    eventlocal.retry = retrypolicies(eventargs)
+    eventlocal.cache = cachesettings(eventargs)
+    started = time.time()
+    processed = True
+
+    # The deadline of a group starts when the drain worker executes it
+    eventlocal.deadline = eventargs.deadline and started + eventargs.deadline
+    eventlocal.expires = eventlocal.deadline
+    eventlocal.minimum = getattr(
+        eventargs, 'deadline_minimum', deadline_minimum)
+    eventlocal.schedule = {
+        'executed': [], 'skipped': [], 'timedout': [], 'running': []}
+
+    try:
+        execmodule(eventargs, actions)
+
+    # Groups which gave up before executing (like failing to load the
+    # module or to get an execution slot) are kept for the next drain
+    except SystemExit as emsg:
+        if emsg.code:
+            logger.error('Spooled event(s) for host "%s" were not executed '
+                         % eventargs.host + '(exit code %s)' % emsg.code)
+
+            processed = False
+
+    except Exception as emsg:
+        logger.error('Unhandled error while executing spooled event(s) ' +
+                     'for host "%s": "%s"' % (eventargs.host, emsg))
+
+        processed = False
+
+    recordtiming('total', time.time() - started)
+    reporttimings(eventargs, eventlocal.timings)
+
+    if eventargs.deadline:
+        reportschedule(eventlocal.schedule, eventlocal.deadline)
+
+    return processed
+
+
+# Executes spooled events in batches grouped by module and target host
+def drain(args):
+    logger.info('Draining events from spool directory "%s"' % args.drain)
+
+    for subdir in ('tmp', 'new', 'cur'):
+        if not os.path.isdir(os.path.join(args.drain, subdir)):
+            os.makedirs(os.path.join(args.drain, subdir), 0700)
+
+    recoverevents(args.drain)
+
+    while True:
+        claimed = claimevents(args.drain, args.batch_size)
+
+        if not claimed:
+            if not args.interval:
+                break
+
+            time.sleep(args.interval)
+
+            continue
+
+        logger.info('Claimed batch of %i spooled event(s)' % len(claimed))
+
+        groups = collections.OrderedDict()
+
+        for filename, event, record in claimed:
+            actions = record.pop('actions')
+            eventargs = argparse.Namespace(**record)
+
+            logger.info('Processing spooled event for host "%s" and '
+                        % eventargs.name +
+                        'service "%s"' % eventargs.description)
+
+            if not isowner(eventargs):
+                releaseevents([(filename, event)], True)
+
+                continue
+
+            # Events with identical arguments share one module execution
+            key = json.dumps(sorted(
+                (name, value) for name, value in record.items()
+                if name not in spool_event_fields))
+
+            if key not in groups:
+                groups[key] = (eventargs, [], [])
+
+            groups[key][1].extend(actions)
+            groups[key][2].append((filename, event))
+
+        logger.info('Executing %i group(s) of spooled event(s)' % len(groups))
+
+        results = runparallel(
+            draingroup, [group[:2] for group in groups.values()],
+            args.workers)
+
+        # Events of failed groups are recovered when a drain worker starts
+        for group, (finished, processed) in zip(groups.values(), results):
+            if not (finished and processed):
+                logger.error('Leaving %i spooled event(s) for host "%s" in '
+                             % (len(group[2]), group[0].host) +
+                             'the spool directory')
+
+            releaseevents(group[2], finished and processed)
+
+    modules.close()
+
+
+# Handles an event received by the daemon
+def dispatch(argv):
+    started = time.time()
+
+    try:
+        args = aparser(argv)
+
+    except SystemExit:
+        logger.error('Failed to parse event arguments: "%s"' % argv)
+
+        return
+
+    try:
+        handler(args, time.time() - started)
+
+    except SystemExit:
+        pass
+
+    except Exception as emsg:
+        logger.error('Unhandled error while processing event for host ' +
+                     '"%s" and service "%s": "%s"'
+                     % (args.name, args.description, emsg))
+
+
+# Reads an event from a client connection and handles it
+def serveclient(connection):
+    connection.settimeout(5)
+    data = []
+
+    try:
+        while True:
+            chunk = connection.recv(4096)
+
+            if not chunk:
+                break
+
+            data.append(chunk)
+
+    except socket.error as emsg:
+        logger.error('Failed to read event from client: "%s"' % emsg)
+
+        return
+
+    finally:
+        connection.close()
+
+    # Connections without data only check if the daemon is running
+    if not data:
+        return
+
+    try:
+        argv = rules.utf8(json.loads(''.join(data)))
+
+    except ValueError:
+        argv = None
+
+    if not (isinstance(argv, list) and
+            all(isinstance(argument, str) for argument in argv)):
+        logger.error('Received malformed event from client')
+
+        return
+
+    logger.debug('Received event with arguments "%s"' % argv)
+
+    dispatch(argv)
+
+
+# Checks if a daemon is listening on an existing socket file
+def socketinuse(path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(5)
+
+    try:
+        client.connect(path)
+
+    except socket.error as emsg:
+        return emsg.errno not in (errno.ECONNREFUSED, errno.ENOENT)
+
+    finally:
+        client.close()
+
+    return True
+
+
+# Runs as a persistent daemon accepting events on a Unix socket
+def daemon(args):
+    import Queue
+
+    logger.info('Starting notss-eh daemon on socket "%s"' % args.socket)
+
+    if os.path.exists(args.socket):
+        if socketinuse(args.socket):
+            logger.error('Socket "%s" is used by another running daemon'
+                         % args.socket)
+
+            exit(2)
+
+        logger.debug('Removing stale socket file "%s"' % args.socket)
+
+        os.unlink(args.socket)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # The socket file is created with the requested permissions
+    umask = os.umask(0777 & ~int(args.socket_mode, 8))
+
+    try:
+        listener.bind(args.socket)
+        listener.listen(128)
+
+    except (socket.error, OSError) as emsg:
+        logger.error('Failed to listen on socket "%s": "%s"'
+                     % (args.socket, emsg))
+
+        exit(2)
+
+    finally:
+        os.umask(umask)
+
+    # Accepted connections wait for a free worker in a bounded queue
+    pending = Queue.Queue(args.workers)
+
+    def worker():
+        while True:
+            serveclient(pending.get())
+
+    for number in range(args.workers):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    # Makes sure that the socket file is removed on shutdown
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        while True:
+            try:
+                connection, address = listener.accept()
+
+            except socket.error as emsg:
+                logger.debug('Failed to accept connection: "%s"' % emsg)
+
+                continue
+
+            # Waits for a free worker - the timeout keeps the daemon
+            # responsive to SIGTERM while all workers are busy
+            while True:
+                try:
+                    pending.put(connection, timeout=1)
+
+                    break
+
+                except Queue.Full:
+                    continue
+
+    except KeyboardInterrupt:
+        logger.info('Shutting down notss-eh daemon')
+
+    modules.close()
+    listener.close()
+    os.unlink(args.socket)
+
+
+# Parses a "SERVICE ALERT" or "HOST ALERT" line from the core log file
+def parsealert(line, host_description):
+    match = re.match(r'\[\d+\] (SERVICE|HOST) ALERT: (.*)$', line)
+
+    if not match:
+        return None
+
+    if match.group(1) == 'SERVICE':
+        fields = match.group(2).split(';', 5)
+
+        if len(fields) < 5:
+            return None
+
+        name, description, state, state_type, attempt = fields[:5]
+
+    else:
+        fields = match.group(2).split(';', 4)
+
+        if len(fields) < 4:
+            return None
+
+        name, state, state_type, attempt = fields[:4]
+        description = host_description
+
+        # Host states are mapped to the service states known by the handler
+        state = {'UP': 'OK', 'DOWN': 'CRITICAL',
+                 'UNREACHABLE': 'UNKNOWN'}.get(state, state)
+
+    if not attempt.isdigit():
+        return None
+
+    return name, description, state, state_type, attempt
+
+
+# Reads the log file inode and offset of the last handled events
+def loadcheckpoint(checkpoint):
+    try:
+        with open(checkpoint) as position:
+            recorded = json.load(position)
+
+        return recorded['inode'], recorded['offset']
+
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+# Atomically records the log file inode and offset of handled events
+def savecheckpoint(checkpoint, inode, offset):
+    temporary = '%s.%i' % (checkpoint, os.getpid())
+
+    try:
+        with open(temporary, 'w') as position:
+            json.dump({'inode': inode, 'offset': offset,
+                       'time': time.time()}, position)
+
+        os.rename(temporary, checkpoint)
+
+    except (IOError, OSError) as emsg:
+        logger.error('Failed to write checkpoint file "%s": "%s"'
+                     % (checkpoint, emsg))
+
+
+# Handles the events of a host/service pair in the order they were logged
+def tailgroup(events):
+    from notss_eh import fastpath
+
+    for argv in events:
+        # Most state changes don't result in actions
+        fast = fastpath(argv)
+
+        if fast:
+            logger.debug('%s (host "%s", service "%s")'
+                         % (fast[1], argv[3], argv[5]))
+
+            continue
+
+        dispatch(argv)
+
+
+# Opens the log file and seeks to the checkpoint or the end of the file
+def tailopen(args, checkpoint):
+    try:
+        logfile = os.open(args.tail, os.O_RDONLY)
+
+    except OSError as emsg:
+        logger.debug('Failed to open log file "%s": "%s"' % (args.tail, emsg))
+
+        return None, None, None
+
+    status = os.fstat(logfile)
+
+    if checkpoint and checkpoint[0] == status.st_ino:
+        if checkpoint[1] <= status.st_size:
+            offset = checkpoint[1]
+
+        else:
+            logger.info('Log file "%s" was truncated - reading from the '
+                        % args.tail + 'beginning')
+
+            offset = 0
+
+    # Lines of a log file not seen before are new
+    elif checkpoint:
+        logger.info('Log file "%s" was rotated - reading from the beginning'
+                    % args.tail)
+
+        offset = 0
+
+    elif args.from_start:
+        offset = 0
+
+    else:
+        offset = status.st_size
+
+    os.lseek(logfile, offset, os.SEEK_SET)
+
+    return logfile, status.st_ino, offset
+
+
+# Handles events logged by the monitoring core as they are appended
+def tail(args):
+    logger.info('Tailing log file "%s" for state changes' % args.tail)
+
+    checkdir = os.path.dirname(args.checkpoint)
+
+    if checkdir and not os.path.isdir(checkdir):
+        os.makedirs(checkdir)
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    checkpoint = loadcheckpoint(args.checkpoint)
+    logfile = None
+    buffered = ''
+
+    try:
+        while True:
+            if logfile is None:
+                logfile, inode, offset = tailopen(args, checkpoint)
+                buffered = ''
+
+                if logfile is None:
+                    time.sleep(args.interval)
+
+                    continue
+
+                logger.debug('Reading log file "%s" from offset %i'
+                             % (args.tail, offset))
+
+            # Reads until a batch of complete lines is buffered
+            while buffered.count('\n') < args.batch_size:
+                chunk = os.read(logfile, 65536)
+
+                if not chunk:
+                    break
+
+                buffered += chunk
+
+            # Incomplete lines are kept until the rest has been written
+            lines = buffered.split('\n', args.batch_size)
+            buffered = lines.pop()
+
+            if not lines:
+                # Switches to the new file when the log file was rotated
+                try:
+                    status = os.stat(args.tail)
+
+                except OSError:
+                    status = None
+
+                if status and (status.st_ino != inode or
+                               status.st_size < offset):
+                    os.close(logfile)
+                    logfile = None
+                    checkpoint = (inode, offset)
+
+                    continue
+
+                time.sleep(args.interval)
+
+                continue
+
+            groups = collections.OrderedDict()
+
+            for line in lines:
+                offset += len(line) + 1
+                alert = parsealert(line, args.host_description)
+
+                if not alert:
+                    continue
+
+                name, description, state, state_type, attempt = alert
+
+                groups.setdefault((name, description), []).append([
+                    '--host', name, '--name', name,
+                    '--description', description, '--state', state,
+                    '--state-type', state_type,
+                    '--attempt', attempt] + args.event)
+
+            if groups:
+                logger.info(
+                    'Handling %i event(s) for %i host/service pair(s)'
+                    % (sum(len(events) for events in groups.values()),
+                       len(groups)))
+
+                runparallel(tailgroup, groups.values(), args.workers)
+
+            # Events of the batch are handled again if interrupted before
+            checkpoint = (inode, offset)
+            savecheckpoint(args.checkpoint, inode, offset)
+
+    except KeyboardInterrupt:
+        logger.info('Stopped tailing log file "%s"' % args.tail)
+
+    modules.close()
+
+
+# Main function
+def main():
+    global logger
+
+    # Daemon mode has its own set of arguments
+    if sys.argv[1:2] == ['--daemon']:
+        args = daemonparser()
+
+        logger = logsetup(args.logging, args.verbose, args.log_format,
+                          args.log_queue, args.log_overflow)
+
+        daemon(args)
+        exit(0)
+
+    # Tail mode handles events logged by the monitoring core
+    if sys.argv[1:2] == ['--tail']:
+        args = tailparser()
+
+        logger = logsetup(args.logging, args.verbose, args.log_format,
+                          args.log_queue, args.log_overflow)
+
+        tail(args)
+        exit(0)
+
+    # Drain mode executes spooled events
+    if sys.argv[1:2] == ['--drain']:
+        args = drainparser()
+        logger = logsetup(args.logging, args.verbose, args.log_format,
+                          args.log_queue, args.log_overflow)
+
+        drain(args)
+        exit(0)
+
+    # Parses command line arguments
+    started = time.time()
+    args = aparser()
+    parsed = time.time() - started
+
+    # Non important function to generate data output
+    if args.funk:
+        nothingtoseehere()
+        exit(3)
+
+    # Configures application logging
+    logger = logsetup(args.logging, args.verbose, args.log_format,
+                      args.log_queue, args.log_overflow)
+
+    try:
+        handler(args, parsed, watchdog=True)
+
+    finally:
+        modules.close()
@@ -0,0 +1,130 @@
+'''notss-eh - Non-blocking and structured logging.
+
+Loaded by "logsetup" when a log queue or the JSON log format is used.'''
+
+import threading
+import logging
+import Queue
+import json
+
+
+# Ships log records from a bounded queue to a handler in a background thread
+class QueueHandler(logging.Handler):
+    def __init__(self, target, size, overflow):
+        logging.Handler.__init__(self)
+
+        self.target = target
+        self.overflow = overflow
+        self.records = Queue.Queue(size)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+        self.shipper = threading.Thread(target=self.ship)
+        self.shipper.daemon = True
+        self.shipper.start()
+
+    def emit(self, record):
+        # Records may reference objects that change before they are shipped
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+
+            record.exc_info = None
+
+        if self.overflow == 'block':
+            self.records.put(record)
+
+            return
+
+        try:
+            self.records.put_nowait(record)
+
+        except Queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+
+    def ship(self):
+        while True:
+            record = self.records.get()
+
+            if record is not None:
+                self.target.handle(record)
+
+            # Drops are reported after the records queued before them
+            if record is None or self.records.empty():
+                with self.dropped_lock:
+                    dropped, self.dropped = self.dropped, 0
+
+                if dropped:
+                    self.target.handle(logging.makeLogRecord({
+                        'name': 'notss-eh', 'levelno': logging.WARNING,
+                        'levelname': 'WARNING',
+                        'msg': 'Dropped %i log record(s) since the log ' %
+                        dropped + 'queue was full'}))
+
+            if record is None:
+                return
+
+    def close(self):
+        # Ships the remaining records before the process exits
+        if self.shipper.is_alive():
+            self.records.put(None)
+            self.shipper.join(5)
+
+        self.target.close()
+        logging.Handler.close(self)
+
+
+# Adds the host and service of the event handled by the thread to records
+class EventFilter(logging.Filter):
+    def __init__(self, context):
+        logging.Filter.__init__(self)
+
+        self.context = context
+
+    def filter(self, record):
+        for field in ('host', 'service'):
+            if not hasattr(record, field):
+                setattr(record, field, getattr(self.context, field, None))
+
+        return True
+
+
+# Formats log records as compact JSON lines
+class JSONFormatter(logging.Formatter):
+    fields = ('host', 'service', 'action', 'phase', 'duration')
+
+    def __init__(self, prefix=''):
+        logging.Formatter.__init__(self)
+
+        self.prefix = prefix
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 6), 'level': record.levelname,
+            'message': record.getMessage()}
+
+        for field in self.fields:
+            value = getattr(record, field, None)
+
+            if isinstance(value, float):
+                value = round(value, 6)
+
+            if value is not None:
+                entry[field] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        # Command output may contain anything
+        for field, value in entry.items():
+            if isinstance(value, str):
+                entry[field] = value.decode('utf-8', 'replace')
+
+        return self.prefix + json.dumps(entry, separators=(',', ':'))
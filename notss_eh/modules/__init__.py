@@ -0,0 +1,104 @@
+'''notss-eh - Registry of action execution modules.
+
+Execution modules are Python modules that provide:
+
+  - A docstring, used as help text for the module
+  - "arguments(parser)", adding the module options to an argument parser
+  - "execute(args, actions, coalesce)", running the actions for an event and
+    returning True if all of them were successful
+  - "close()" (optional), releasing resources when the event-handler exits
+
+Only the module selected for an event is imported. Modules are looked up
+among the built-in modules, in the plugin directory ("<name>.py") and as
+"notss_eh.modules" entry points of installed Python packages.'''
+
+import threading
+import os
+
+# Built-in execution modules and their help text
+builtin = (
+    ('nrpe', 'Executes command(s) with NRPE queries'),
+    ('ssh', 'Executes command(s) with SSH'),
+    ('shell', 'Executes local shell command(s)'),
+    ('snmp', 'Executes SNMP set requests'))
+
+# Entry point group for execution modules provided by other packages
+entrypoints = 'notss_eh.modules'
+
+# Execution modules that have been loaded by the process
+loaded = {}
+loaded_lock = threading.Lock()
+
+
+# Returns the names of available execution modules without importing them
+def available(directory=None):
+    names = [name for name, description in builtin]
+
+    if directory and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(filename)
+
+            if extension == '.py' and name not in names:
+                names.append(name)
+
+    return names
+
+
+# Imports and returns an execution module by name
+def load(name, directory=None):
+    with loaded_lock:
+        if name in loaded:
+            return loaded[name]
+
+        module = None
+
+        if name in dict(builtin):
+            module = __import__(
+                'notss_eh.modules.%s' % name, fromlist=['execute'])
+
+        elif directory and os.path.isfile(
+                os.path.join(directory, '%s.py' % name)):
+
+            import imp
+
+            module = imp.load_source(
+                'notss_eh_plugin_%s' % name,
+                os.path.join(directory, '%s.py' % name))
+
+        else:
+            # Scanning installed packages is slow, so it is the last resort
+            try:
+                import pkg_resources
+
+            except ImportError:
+                return None
+
+            for entrypoint in pkg_resources.iter_entry_points(
+                    entrypoints, name):
+
+                module = entrypoint.load()
+
+                break
+
+        if module is None:
+            return None
+
+        for attribute in ('arguments', 'execute'):
+            if not callable(getattr(module, attribute, None)):
+                raise ImportError(
+                    'Execution module "%s" does not provide "%s"'
+                    % (name, attribute))
+
+        loaded[name] = module
+
+        return module
+
+
+# Releases resources held by all loaded execution modules
+def close():
+    with loaded_lock:
+        modules = loaded.values()
+
+    for module in modules:
+        if callable(getattr(module, 'close', None)):
+            module.close()
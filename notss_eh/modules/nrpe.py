@@ -0,0 +1,268 @@
+'''Executes command(s) with NRPE queries.'''
+
+try:
+    import logging
+    import struct
+    import socket
+    import zlib
+    import os
+
+    from notss_eh.core import runcommand, runactions, readexact, timelimit
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+logger = logging.getLogger('notss-eh')
+
+# Largest buffer accepted in version 3 and 4 response packets
+buffer_limit = 65536
+
+
+# Adds the module arguments to the argument parser
+def arguments(parser):
+    parser.add_argument('-H', '--host',
+                        dest='mod_host',
+                        help='Specify optional remote host for execution')
+
+    parser.add_argument('-P', '--port',
+                        dest='mod_port',
+                        help='NRPE port on remote host',
+                        type=int, default=5666)
+
+    parser.add_argument('-b', '--backend',
+                        dest='mod_nrpe_backend',
+                        help='Use the built-in NRPE client or the ' +
+                        '"check_nrpe" plugin for queries',
+                        choices=('native', 'plugin'), default='native')
+
+    parser.add_argument('-p', '--nrpe-plugin',
+                        dest='mod_nrpe_plugin',
+                        help='Location of "check_nrpe" executable ' +
+                        '(used with the "plugin" backend)',
+                        default='/opt/plugins/check_nrpe')
+
+    parser.add_argument('--packet-version',
+                        dest='mod_nrpe_version',
+                        help='NRPE protocol packet version ' +
+                        '(used with the "native" backend)',
+                        type=int, choices=(2, 3), default=2)
+
+    parser.add_argument('-T', '--timeout',
+                        dest='mod_timeout',
+                        help='Seconds to wait for NRPE command result',
+                        type=int, default=50)
+
+    parser.add_argument('-O', '--connect-timeout',
+                        dest='mod_connect_timeout',
+                        help='Seconds to wait for NRPE connection',
+                        type=int, default=10)
+
+    parser.add_argument('-i', '--insecure',
+                        dest='mod_insecure',
+                        help='Disable encryption for connection',
+                        action='store_true', default=False)
+
+    parser.add_argument(
+        '-I', '--ignore', dest='mod_ignore',
+        help='Ignore NRPE status output' +
+        '(can be useful if the triggered plugin does not return any)',
+        action='store_true', default=False)
+
+
+# Builds a NRPE protocol packet
+def nrpepacket(version, packet_type, result_code, buffer):
+    if version == 2:
+        buffer = buffer[:1023].ljust(1024, '\0') + '\0\0'
+        header = '!hhIh'
+        fields = ()
+
+    else:
+        buffer = (buffer + '\0').ljust(1024, '\0')
+        header = '!hhIhhi'
+        fields = (0, len(buffer))
+
+    crc = zlib.crc32(
+        struct.pack(header, version, packet_type, 0, result_code, *fields) +
+        buffer) & 0xffffffff
+
+    return struct.pack(
+        header, version, packet_type, crc, result_code, *fields) + buffer
+
+
+# Reads and verifies a NRPE response packet
+def nrperesponse(connection):
+    header = readexact(connection, 10)
+    version, packet_type, crc, result_code = struct.unpack('!hhIh', header)
+
+    if version == 2:
+        extra = ''
+        buffer = readexact(connection, 1026)
+
+    elif version in (3, 4):
+        extra = readexact(connection, 6)
+        length = struct.unpack('!hi', extra)[1]
+
+        if not 0 <= length <= buffer_limit:
+            raise socket.error(
+                'NRPE protocol error - invalid buffer length %i' % length)
+
+        buffer = readexact(connection, length)
+
+    else:
+        raise socket.error('Unsupported NRPE packet version %i' % version)
+
+    expected = zlib.crc32(
+        struct.pack('!hhIh', version, packet_type, 0, result_code) +
+        extra + buffer) & 0xffffffff
+
+    if packet_type != 2 or crc != expected:
+        raise socket.error('Received invalid NRPE response packet')
+
+    return result_code, buffer.split('\0', 1)[0]
+
+
+# Executes a NRPE query with the built-in protocol client
+def nrpequery(host, port, command, version, insecure,
+              connect_timeout, timeout):
+
+    import shlex
+
+    # Arguments are specified like for "check_nrpe": "command -a arg1 arg2"
+    arguments = shlex.split(command)
+
+    if '-a' in arguments:
+        index = arguments.index('-a')
+        arguments = arguments[:index] + arguments[index + 1:]
+
+    connection = socket.create_connection((host, port), connect_timeout)
+    connection.settimeout(timeout)
+
+    try:
+        if not insecure:
+            import ssl
+
+            # NRPE uses anonymous Diffie-Hellman by default
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.verify_mode = ssl.CERT_NONE
+            context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+            context.options |= getattr(ssl, 'OP_NO_TLSv1_3', 0)
+
+            try:
+                context.set_ciphers('ALL:ADH:!MD5:@SECLEVEL=0')
+
+            except ssl.SSLError:
+                context.set_ciphers('ALL:ADH:!MD5')
+
+            connection = context.wrap_socket(connection)
+
+        connection.sendall(nrpepacket(version, 1, 0, '!'.join(arguments)))
+
+        return nrperesponse(connection)
+
+    finally:
+        connection.close()
+
+
+# Execution module for NRPE commands
+def execmod_nrpe(actions, wait, parallel, coalesce, host, mod_host, port,
+                 backend, nrpe_plugin, version, insecure, ignore,
+                 timeout, connect_timeout):
+    if mod_host:
+        logger.debug('A seperate execution host has been specified')
+
+        host = mod_host
+
+    logger.info('Running NRPE commands on host "%s"' % host)
+
+    if insecure:
+        logger.info('NRPE session encryption has been disabled')
+
+    if ignore:
+        logger.info('NRPE status output checking has been disabled')
+
+    # Checking if the "check_nrpe" plugin can be found
+    if backend == 'plugin' and not os.path.isfile(nrpe_plugin):
+        logger.error('Could not find the NRPE plugin at "%s"' % nrpe_plugin)
+
+        return False
+
+    def execute(command):
+        logger.info('Running NRPE command "%s"' % command)
+
+        if backend == 'native':
+            try:
+                result_code, output = nrpequery(
+                    host, port, command, version, insecure,
+                    timelimit(connect_timeout), timelimit(timeout))
+
+            except (socket.error, IOError) as emsg:
+                return 3, ('', 'NRPE query failed: %s' % emsg)
+
+            # Raised for arguments with unbalanced quotes or escapes
+            except ValueError as emsg:
+                return 3, ('', 'Invalid action: %s' % emsg)
+
+            return result_code, (output, '')
+
+        # The plugin only accepts whole seconds
+        limited = max(int(timelimit(timeout)), 1)
+
+        if insecure:
+            plugin = '%s -t %i -H %s -p %i -n -c %s' % (
+                nrpe_plugin, limited, host, port, command)
+
+        else:
+            plugin = '%s -t %i -H %s -p %i -c %s' % (
+                nrpe_plugin, limited, host, port, command)
+
+        # The plugin gets a few seconds to report its own timeout
+        returncode, output, timedout = runcommand(
+            plugin, '/bin/sh', timelimit(connect_timeout + timeout + 5),
+            65536)
+
+        if timedout:
+            logger.error('NRPE plugin for command "%s" timed out' % command)
+
+        return returncode, output
+
+    def report(command, result):
+        returncode, output = result
+
+        if ignore:
+            logger.debug(
+                'Ignoring NRPE command output - ' +
+                'Communicate:\n\n"%s"\n\nStatus code: %i'
+                % (str(output), returncode))
+
+        elif returncode != 0:
+            logger.error('Error occured while executing NRPE command: "%s"'
+                         % str(output))
+
+            return False
+
+        else:
+            logger.info('Command execution successful - output: "%s"'
+                        % output[0].strip())
+
+        return True
+
+    # Decides if a result is successful like "report" for retry policies
+    def outcome(result):
+        returncode, output = result
+
+        return ignore or returncode == 0, returncode, output[0]
+
+    # Running all commands in actions
+    return runactions(actions, wait, parallel, execute, report,
+                      coalesce, 'nrpe:%s:%i' % (host, port), None, outcome)
+
+
+# Executes the actions of an event with the NRPE module
+def execute(args, actions, coalesce):
+    return execmod_nrpe(
+        actions, args.wait, args.parallel, coalesce, args.host,
+        args.mod_host, args.mod_port, args.mod_nrpe_backend,
+        args.mod_nrpe_plugin, args.mod_nrpe_version,
+        args.mod_insecure, args.mod_ignore,
+        args.mod_timeout, args.mod_connect_timeout)
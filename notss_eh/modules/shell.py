@@ -0,0 +1,155 @@
+'''Executes local shell command(s).'''
+
+try:
+    import logging
+    import os
+
+    from notss_eh.core import (
+        runcommand, runactions, actionstages, batchscript, batchsplit,
+        timelimit)
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+logger = logging.getLogger('notss-eh')
+
+
+# Adds the module arguments to the argument parser
+def arguments(parser):
+    parser.add_argument(
+        '-s', '--shell', dest='mod_shell_shell',
+        help='Specifies system shell',
+        choices=('/bin/sh', '/bin/bash', '/usr/local/bin/bash'),
+        default='/bin/sh')
+
+    parser.add_argument(
+        '-r', '--returncode', dest='mod_shell_retcode',
+        help='Specify return code to verify successful execution of commands',
+        type=int)
+
+    parser.add_argument(
+        '-m', '--mute', dest='mod_shell_mute',
+        help='Mute the output of the shell command',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '-B', '--batch', dest='mod_batch',
+        help='Execute all actions with a single shell invocation',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '-T', '--timeout', dest='mod_shell_timeout',
+        help='Seconds before a shell command and its child processes ' +
+        'are killed (0 disables the timeout)',
+        type=int, default=300)
+
+    parser.add_argument(
+        '-L', '--output-limit', dest='mod_shell_limit',
+        help='Maximum number of bytes kept from the end of each output ' +
+        'stream of a shell command',
+        type=int, default=65536)
+
+
+# Execution module for local system shell commands
+def execmod_shell(actions, wait, parallel, coalesce, host, shell, returncode,
+                  mute, timeout, limit, batch):
+    logger.info(
+        'Executing %i commands with shell "%s"'
+        % (len(sum(actionstages(actions, parallel), [])), shell))
+
+    if mute:
+        logger.debug('Shell command output muting is enabled')
+
+    if returncode or returncode == 0:
+        logger.debug(
+            'Verifying success of command execution with return code %i'
+            % returncode)
+
+    else:
+        logger.debug('Command execution result checking is disabled')
+
+    # Commands can use the target host address from the environment
+    environment = dict(os.environ, NOTSS_EH_HOST=host)
+
+    def execute(action):
+        logger.info('Executing shell command "%s"' % action)
+
+        limited = timelimit(timeout)
+
+        status, output, timedout = runcommand(
+            action, shell, limited, limit, environment)
+
+        if timedout:
+            logger.error('Shell command "%s" timed out after %i second(s)'
+                         % (action, limited))
+
+        return status, output
+
+    def executebatch(actions):
+        marker, script = batchscript(actions, wait)
+        logger.debug('Executing batch script:\n\n%s' % script)
+
+        limited = timelimit(timeout)
+
+        status, output, timedout = runcommand(
+            script, shell, limited, limit * len(actions), environment)
+
+        if timedout:
+            logger.error('Shell command batch timed out after %i second(s)'
+                         % limited)
+
+        return [(code, (stdout, stderr)) for code, stdout, stderr in
+                batchsplit(marker, len(actions), output[0], output[1])]
+
+    def report(action, result):
+        status, output = result
+
+        if not mute:
+            logger.info(
+                'Output of shell of command "%s":\nstdout: "%s"'
+                % (action, str(output[0]).strip()) +
+                '\nstderr: "%s"' % str(output[1]).strip())
+
+        if returncode is None:
+            return True
+
+        logger.debug('Checking return code for command "%s"' % action)
+
+        if status is None:
+            logger.error(
+                'Command "%s" did not finish within the batch' % action)
+
+            return False
+
+        elif status == returncode:
+            logger.info(
+                'Command "%s" executed successfully ' % action +
+                '(return code %i was matched)' % returncode)
+
+            return True
+
+        else:
+            logger.error(
+                'Command "%s" did not execute successfully ' % action +
+                '(return code %i was not matched)' % returncode)
+
+            return False
+
+    # Decides if a result is successful like "report" for retry policies
+    def outcome(result):
+        status, output = result
+
+        return (returncode is None or status == returncode, status, output[0])
+
+    return runactions(actions, wait, parallel, execute, report,
+                      coalesce, 'shell:%s:%s' % (shell, host),
+                      batch and executebatch, outcome)
+
+
+# Executes the actions of an event with the shell module
+def execute(args, actions, coalesce):
+    return execmod_shell(
+        actions, args.wait, args.parallel, coalesce, args.host,
+        args.mod_shell_shell, args.mod_shell_retcode, args.mod_shell_mute,
+        args.mod_shell_timeout, args.mod_shell_limit, args.mod_batch)
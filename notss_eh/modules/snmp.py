@@ -0,0 +1,824 @@
+'''Executes SNMP set requests.'''
+
+try:
+    import logging
+    import threading
+    import binascii
+    import hashlib
+    import random
+    import struct
+    import socket
+    import shlex
+    import hmac
+    import time
+    import os
+    import re
+
+    from notss_eh.core import (
+        runactions, actionstages, timelimit, remaining, skipactions,
+        minimumleft)
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+logger = logging.getLogger('notss-eh')
+
+# ASN.1 tags for the value types of actions (like for "snmpset")
+snmptypes = {
+    'i': 0x02, 's': 0x04, 'x': 0x04, 'o': 0x06,
+    'a': 0x40, 'c': 0x41, 'u': 0x42, 't': 0x43}
+
+# Names of SNMP error status codes
+snmperrors = (
+    'noError', 'tooBig', 'noSuchName', 'badValue', 'readOnly', 'genErr',
+    'noAccess', 'wrongType', 'wrongLength', 'wrongEncoding', 'wrongValue',
+    'noCreation', 'inconsistentValue', 'resourceUnavailable', 'commitFailed',
+    'undoFailed', 'authorizationError', 'notWritable', 'inconsistentName')
+
+# Errors reported by SNMPv3 agents for failed requests
+usmerrors = {
+    '1.3.6.1.6.3.15.1.1.1.0': 'unsupported security level',
+    '1.3.6.1.6.3.15.1.1.2.0': 'not in time window',
+    '1.3.6.1.6.3.15.1.1.3.0': 'unknown user name',
+    '1.3.6.1.6.3.15.1.1.4.0': 'unknown engine ID',
+    '1.3.6.1.6.3.15.1.1.5.0': 'wrong digest',
+    '1.3.6.1.6.3.15.1.1.6.0': 'decryption error'}
+
+# Hash functions of the SNMPv3 authentication protocols
+usmhashes = {'MD5': hashlib.md5, 'SHA': hashlib.sha1}
+
+# Discovered SNMPv3 engines shared between events in long-running processes
+snmpengines = {}
+snmpengines_lock = threading.Lock()
+
+
+# Adds the module arguments to the argument parser
+def arguments(parser):
+    parser.add_argument('-H', '--host',
+                        dest='mod_host',
+                        help='Specify optional remote host for execution')
+
+    parser.add_argument('-p', '--port',
+                        dest='mod_port',
+                        help='SNMP port on remote host',
+                        type=int, default=161)
+
+    parser.add_argument('-v', '--snmp-version',
+                        dest='mod_snmp_version',
+                        help='SNMP protocol version',
+                        choices=('2c', '3'), default='2c')
+
+    parser.add_argument('-c', '--community',
+                        dest='mod_snmp_community',
+                        help='Community string (used with version 2c)',
+                        default='private')
+
+    parser.add_argument('-u', '--user',
+                        dest='mod_snmp_user',
+                        help='Security name (used with version 3)')
+
+    parser.add_argument('-a', '--auth-protocol',
+                        dest='mod_snmp_auth',
+                        help='Authentication protocol (used with version 3)',
+                        choices=('MD5', 'SHA'), default='SHA')
+
+    parser.add_argument('-A', '--auth-password',
+                        dest='mod_snmp_auth_password',
+                        help='Authentication pass phrase ' +
+                        '(enables authentication with version 3)')
+
+    parser.add_argument('-x', '--priv-protocol',
+                        dest='mod_snmp_priv',
+                        help='Privacy protocol (used with version 3)',
+                        choices=('DES', 'AES'), default='AES')
+
+    parser.add_argument('-X', '--priv-password',
+                        dest='mod_snmp_priv_password',
+                        help='Privacy pass phrase ' +
+                        '(enables encryption with version 3)')
+
+    parser.add_argument('-n', '--context',
+                        dest='mod_snmp_context',
+                        help='Context name (used with version 3)',
+                        default='')
+
+    parser.add_argument(
+        '-T', '--timeout', dest='mod_timeout',
+        help='Seconds to wait for a response to each SNMP request',
+        type=int, default=5)
+
+    parser.add_argument(
+        '-r', '--retries', dest='mod_snmp_retries',
+        help='Number of times unanswered SNMP requests are resent',
+        type=int, default=2)
+
+    parser.add_argument(
+        '-m', '--max-varbinds', dest='mod_snmp_max_varbinds',
+        help='Maximum number of actions combined in a single set request',
+        type=int, default=32)
+
+    parser.add_argument(
+        '-N', '--no-batch', dest='mod_batch',
+        help='Send a separate set request for every action',
+        action='store_false', default=True)
+
+    parser.add_argument(
+        '-y', '--verify', dest='mod_snmp_verify',
+        help='Read back set values to verify that they were applied',
+        action='store_true', default=False)
+
+
+# Encodes a BER length field
+def berlength(length):
+    if length < 0x80:
+        return chr(length)
+
+    encoded = ''
+
+    while length:
+        encoded = chr(length & 0xff) + encoded
+        length >>= 8
+
+    return chr(0x80 | len(encoded)) + encoded
+
+
+# Encodes a BER type-length-value field
+def berencode(tag, value):
+    return chr(tag) + berlength(len(value)) + value
+
+
+# Encodes an integer (or an unsigned application type) as BER
+def berinteger(number, tag=0x02):
+    encoded = ''
+
+    while True:
+        encoded = chr(number & 0xff) + encoded
+        number >>= 8
+
+        if number == 0 and not ord(encoded[0]) & 0x80:
+            break
+
+        if number == -1 and ord(encoded[0]) & 0x80:
+            break
+
+    return berencode(tag, encoded)
+
+
+# Encodes an object identifier as BER
+def beroid(oid):
+    parts = [int(part) for part in oid.strip('.').split('.')]
+
+    if len(parts) < 2 or parts[0] > 2 or [part for part in parts if part < 0]:
+        raise ValueError('Invalid object identifier "%s"' % oid)
+
+    encoded = ''
+
+    for part in [parts[0] * 40 + parts[1]] + parts[2:]:
+        chunk = chr(part & 0x7f)
+        part >>= 7
+
+        while part:
+            chunk = chr(0x80 | part & 0x7f) + chunk
+            part >>= 7
+
+        encoded += chunk
+
+    return berencode(0x06, encoded)
+
+
+# Decodes the first BER field, returning tag, value and remaining data
+def berdecode(data):
+    if len(data) < 2:
+        raise ValueError('Truncated BER field')
+
+    tag = ord(data[0])
+    length = ord(data[1])
+    offset = 2
+
+    if length & 0x80:
+        offset += length & 0x7f
+        length = int(binascii.hexlify(data[2:offset]) or '0', 16)
+
+    if len(data) < offset + length:
+        raise ValueError('Truncated BER field')
+
+    return tag, data[offset:offset + length], data[offset + length:]
+
+
+# Decodes all fields of a BER sequence
+def bersequence(data):
+    fields = []
+
+    while data:
+        tag, value, data = berdecode(data)
+        fields.append((tag, value))
+
+    return fields
+
+
+# Decodes a BER value to a comparable Python value
+def bervalue(tag, value):
+    if tag in (0x02, 0x41, 0x42, 0x43, 0x46):
+        number = int(binascii.hexlify(value) or '0', 16)
+
+        if tag == 0x02 and value and ord(value[0]) & 0x80:
+            number -= 1 << (8 * len(value))
+
+        return number
+
+    if tag == 0x06:
+        parts = []
+        part = 0
+
+        for byte in value:
+            part = (part << 7) | (ord(byte) & 0x7f)
+
+            if not ord(byte) & 0x80:
+                parts.append(part)
+                part = 0
+
+        if not parts:
+            return ''
+
+        first = min(parts[0] // 40, 2)
+
+        return '.'.join(
+            str(part) for part in [first, parts[0] - first * 40] + parts[1:])
+
+    if tag == 0x40:
+        return socket.inet_ntoa(value)
+
+    if tag == 0x05:
+        return None
+
+    return value
+
+
+# Formats a BER value for logging
+def berformat(tag, value):
+    if tag in (0x80, 0x81, 0x82):
+        return ('noSuchObject', 'noSuchInstance', 'endOfMibView')[tag - 0x80]
+
+    value = bervalue(tag, value)
+
+    if tag == 0x04 and re.search(r'[^\t\n\r\x20-\x7e]', value):
+        return '0x%s' % binascii.hexlify(value)
+
+    return str(value)
+
+
+# Converts an action ("OID TYPE VALUE") to an encoded variable binding
+def snmpvarbind(action):
+    arguments = shlex.split(action)
+
+    if len(arguments) != 3 or arguments[1] not in snmptypes:
+        raise ValueError('Expected "OID TYPE VALUE" with type being one ' +
+                         'of %s' % ', '.join(sorted(snmptypes)))
+
+    oid, kind, value = arguments
+    tag = snmptypes[kind]
+
+    if kind == 'i':
+        encoded = berinteger(int(value))
+
+        if not -2 ** 31 <= int(value) < 2 ** 31:
+            raise ValueError('Integer value out of range')
+
+    elif kind in ('c', 'u', 't'):
+        encoded = berinteger(int(value), tag)
+
+        if not 0 <= int(value) < 2 ** 32:
+            raise ValueError('Unsigned value out of range')
+
+    elif kind == 'x':
+        try:
+            encoded = berencode(tag, binascii.unhexlify(
+                re.sub(r'[\s:]|^0x', '', value)))
+
+        except TypeError:
+            raise ValueError('Invalid hexadecimal value "%s"' % value)
+
+    elif kind == 'a':
+        try:
+            encoded = berencode(tag, socket.inet_aton(value))
+
+        except socket.error:
+            raise ValueError('Invalid IP address "%s"' % value)
+
+    elif kind == 'o':
+        encoded = beroid(value)
+
+    else:
+        encoded = berencode(tag, value)
+
+    return bervalue(0x06, beroid(oid)[2:]), encoded
+
+
+# Encodes a SNMP PDU
+def snmppdu(pdutype, requestid, varbinds):
+    return berencode(pdutype, (
+        berinteger(requestid) + berinteger(0) + berinteger(0) +
+        berencode(0x30, ''.join(
+            berencode(0x30, beroid(oid) + value) for oid, value in varbinds))))
+
+
+# Decodes a SNMP PDU
+def snmpparsepdu(pdutype, pdu):
+    fields = bersequence(pdu)
+
+    varbinds = []
+
+    for tag, varbind in bersequence(fields[3][1]):
+        (oidtag, oid), (tag, value) = bersequence(varbind)
+        varbinds.append((bervalue(0x06, oid), tag, value))
+
+    return (pdutype, bervalue(0x02, fields[0][1]),
+            bervalue(0x02, fields[1][1]), bervalue(0x02, fields[2][1]),
+            varbinds)
+
+
+# Localizes a SNMPv3 pass phrase for an engine (RFC 3414, A.2)
+def usmkey(hashfunc, password, engineid):
+    expanded = (password * (1048576 // len(password) + 1))[:1048576]
+    key = hashfunc(expanded).digest()
+
+    return hashfunc(key + engineid + key).digest()
+
+
+# Returns the PyCrypto cipher modules used for SNMPv3 privacy
+def usmciphers():
+    from Crypto.Cipher import AES, DES
+
+    return {'AES': AES, 'DES': DES}
+
+
+# Encrypts or decrypts a SNMPv3 scoped PDU with DES-CBC or AES-CFB
+def usmcrypt(priv, key, boots, enginetime, salt, data, encrypt):
+    ciphers = usmciphers()
+
+    if priv == 'DES':
+        iv = ''.join(chr(ord(a) ^ ord(b)) for a, b in zip(key[8:16], salt))
+        cipher = ciphers['DES'].new(key[:8], ciphers['DES'].MODE_CBC, iv)
+
+        if encrypt:
+            return cipher.encrypt(data + '\0' * (-len(data) % 8))
+
+        return cipher.decrypt(data[:len(data) - len(data) % 8])
+
+    iv = struct.pack('!II', boots, enginetime) + salt
+    cipher = ciphers['AES'].new(
+        key[:16], ciphers['AES'].MODE_CFB, iv, segment_size=128)
+
+    if encrypt:
+        return cipher.encrypt(data)
+
+    return cipher.decrypt(data)
+
+
+# Encodes a SNMPv3 message with the user-based security model
+def usmmessage(msgid, flags, engine, user, auth, authkey, priv, privkey,
+               context, pdu):
+
+    engineid, boots, enginetime = engine
+
+    scoped = berencode(
+        0x30, berencode(0x04, engineid) + berencode(0x04, context) + pdu)
+
+    privparams = ''
+
+    if flags & 0x02:
+        if priv == 'DES':
+            privparams = struct.pack('!I', boots) + os.urandom(4)
+
+        else:
+            privparams = os.urandom(8)
+
+        scoped = berencode(0x04, usmcrypt(
+            priv, privkey, boots, enginetime, privparams, scoped, True))
+
+    def build(authparams):
+        security = berencode(0x30, (
+            berencode(0x04, engineid) + berinteger(boots) +
+            berinteger(enginetime) + berencode(0x04, user) +
+            berencode(0x04, authparams) + berencode(0x04, privparams)))
+
+        header = berencode(0x30, (
+            berinteger(msgid) + berinteger(65507) +
+            berencode(0x04, chr(flags)) + berinteger(3)))
+
+        return berencode(0x30, (
+            berinteger(3) + header + berencode(0x04, security) + scoped))
+
+    if not flags & 0x01:
+        return build('')
+
+    # The digest is calculated with zeroed authentication parameters
+    message = build('\0' * 12)
+
+    return build(hmac.new(
+        authkey, message, usmhashes[auth]).digest()[:12])
+
+
+# Decodes a SNMPv3 message, verifying and decrypting it if necessary
+def usmparse(data, auth, authkey, priv, privkey):
+    tag, message, rest = berdecode(data)
+    fields = bersequence(message)
+
+    if bervalue(0x02, fields[0][1]) != 3:
+        raise ValueError('Unexpected SNMP message version')
+
+    header = bersequence(fields[1][1])
+    msgid = bervalue(0x02, header[0][1])
+    flags = ord(header[2][1] or '\0')
+
+    security = bersequence(berdecode(fields[2][1])[1])
+    engineid, authparams, privparams = (
+        security[0][1], security[4][1], security[5][1])
+
+    engine = (engineid, bervalue(0x02, security[1][1]),
+              bervalue(0x02, security[2][1]))
+
+    if flags & 0x01:
+        if not authkey:
+            raise ValueError('Received authenticated message without key')
+
+        field = berencode(0x04, authparams)
+        offset = data.index(field) + len(field) - len(authparams)
+        digest = hmac.new(
+            authkey, data[:offset] + '\0' * len(authparams) +
+            data[offset + len(authparams):],
+            usmhashes[auth]).digest()[:12]
+
+        if not hmac.compare_digest(digest, authparams):
+            raise ValueError('Invalid authentication digest in SNMP message')
+
+    scoped = fields[3][1]
+
+    if flags & 0x02:
+        scoped = berdecode(usmcrypt(
+            priv, privkey, engine[1], engine[2], privparams, scoped,
+            False))[1]
+
+    return msgid, engine, bersequence(scoped)[2]
+
+
+# Sends a SNMP message and waits for the matching response with retries
+def snmpsend(host, port, timeout, retries, build, parse):
+    family, socktype, proto, name, address = socket.getaddrinfo(
+        host, port, 0, socket.SOCK_DGRAM)[0]
+
+    connection = socket.socket(family, socktype, proto)
+
+    try:
+        connection.connect(address)
+
+        for attempt in range(retries + 1):
+            if attempt:
+                logger.debug('Resending SNMP request to "%s" (attempt %i)'
+                             % (host, attempt + 1))
+
+            connection.send(build())
+            deadline = time.time() + timelimit(timeout)
+
+            while time.time() < deadline:
+                connection.settimeout(max(deadline - time.time(), 0.001))
+
+                try:
+                    data = connection.recv(65535)
+
+                except socket.timeout:
+                    break
+
+                except socket.error as emsg:
+                    # Unreachable ports are reported on connected sockets
+                    logger.debug('SNMP request failed: "%s"' % emsg)
+
+                    break
+
+                try:
+                    result = parse(data)
+
+                except (ValueError, IndexError, TypeError) as emsg:
+                    logger.debug('Ignoring invalid SNMP response: "%s"'
+                                 % emsg)
+
+                    continue
+
+                if result is not None:
+                    return result
+
+        raise socket.timeout('No response after %i attempt(s)'
+                             % (retries + 1))
+
+    finally:
+        connection.close()
+
+
+# Execution module for SNMP set requests
+def execmod_snmp(actions, wait, parallel, coalesce, host, mod_host, port,
+                 version, community, user, auth, auth_password, priv,
+                 priv_password, context, timeout, retries, max_varbinds,
+                 batch, verify):
+
+    if mod_host:
+        logger.debug('A seperate execution host has been specified')
+
+        host = mod_host
+
+    logger.info('Running SNMP set requests on host "%s:%i"' % (host, port))
+
+    flags = 0x04
+
+    if version == '3':
+        if not user:
+            logger.error('A security name is required for SNMP version 3')
+
+            return False
+
+        if auth_password:
+            flags |= 0x01
+
+        if priv_password:
+            if not auth_password:
+                logger.error('Privacy requires an authentication pass phrase')
+
+                return False
+
+            flags |= 0x02
+
+            # Trying to import the Python cryptography module
+            try:
+                usmciphers()
+
+            except ImportError:
+                logger.error(
+                    'Failed to import the PyCrypto module (required for ' +
+                    'SNMPv3 privacy) - exiting')
+
+                return False
+
+        logger.info('Using SNMPv3 as user "%s" (authentication: %s, '
+                    % (user, auth if flags & 0x01 else 'none') +
+                    'privacy: %s)' % (priv if flags & 0x02 else 'none'))
+
+    keys = {}
+
+    # Discovers the engine of the SNMPv3 agent or returns it from the cache
+    def engine(refresh=None):
+        with snmpengines_lock:
+            if refresh:
+                snmpengines[(host, port)] = refresh + (time.time(),)
+
+            if (host, port) in snmpengines:
+                engineid, boots, enginetime, local = snmpengines[(host, port)]
+
+                return engineid, boots, enginetime + int(time.time() - local)
+
+        logger.debug('Discovering SNMP engine of host "%s"' % host)
+
+        msgid = random.randint(1, 2 ** 31 - 1)
+
+        def parse(data):
+            responseid, discovered, pdu = usmparse(data, auth, '', priv, '')
+
+            return discovered if responseid == msgid else None
+
+        discovered = snmpsend(
+            host, port, timeout, retries, lambda: usmmessage(
+                msgid, 0x04, ('', 0, 0), '', auth, '', priv, '', '',
+                snmppdu(0xa0, msgid, [])), parse)
+
+        logger.debug('Discovered SNMP engine "%s"'
+                     % binascii.hexlify(discovered[0]))
+
+        return engine(refresh=discovered)
+
+    # Sends a PDU with the configured SNMP version and returns the response
+    def request(pdutype, varbinds, resynced=False):
+        requestid = random.randint(1, 2 ** 31 - 1)
+        pdu = snmppdu(pdutype, requestid, varbinds)
+
+        if version == '2c':
+            def build():
+                return berencode(0x30, (
+                    berinteger(1) + berencode(0x04, community) + pdu))
+
+            def parse(data):
+                fields = bersequence(berdecode(data)[1])
+                response = snmpparsepdu(*fields[2])
+
+                return response if response[1] == requestid else None
+
+            return snmpsend(host, port, timeout, retries, build, parse)
+
+        agent = engine()
+
+        if agent[0] not in keys:
+            hashfunc = usmhashes[auth]
+
+            keys[agent[0]] = (
+                auth_password and usmkey(hashfunc, auth_password, agent[0]),
+                priv_password and usmkey(hashfunc, priv_password, agent[0]))
+
+        authkey, privkey = keys[agent[0]]
+        msgid = random.randint(1, 2 ** 31 - 1)
+
+        def build():
+            return usmmessage(
+                msgid, flags, engine(), user, auth, authkey, priv, privkey,
+                context, pdu)
+
+        def parse(data):
+            responseid, reported, response = usmparse(
+                data, auth, authkey, priv, privkey)
+
+            if responseid != msgid:
+                return None
+
+            return reported, snmpparsepdu(*response)
+
+        reported, response = snmpsend(host, port, timeout, retries,
+                                      build, parse)
+
+        if response[0] != 0xa8:
+            return response
+
+        # Reports contain a single USM statistics counter describing the error
+        error = [usmerrors.get(oid, oid) for oid, tag, value in response[4]]
+        error = error[0] if error else 'unknown error'
+
+        if error in ('not in time window', 'unknown engine ID') and (
+                not resynced):
+            logger.debug('Resynchronizing with SNMP engine of host ' +
+                         '"%s" (%s)' % (host, error))
+
+            engine(refresh=reported)
+
+            return request(pdutype, varbinds, True)
+
+        raise IOError('SNMP agent reported "%s"' % error)
+
+    # Executes set requests for actions, combining them into one or more PDUs
+    def executebatch(actions):
+        results = [None] * len(actions)
+        varbinds = []
+
+        for index, action in enumerate(actions):
+            try:
+                varbinds.append((index, snmpvarbind(action)))
+
+            except ValueError as emsg:
+                results[index] = ('Invalid action: %s' % emsg, None)
+
+        for offset in range(0, len(varbinds), max_varbinds):
+            chunk = varbinds[offset:offset + max_varbinds]
+
+            if len(actions) > 1:
+                logger.info('Sending set request with %i variable binding(s)'
+                            % len(chunk))
+
+            try:
+                pdutype, requestid, status, errorindex, response = request(
+                    0xa3, [varbind for index, varbind in chunk])
+
+            except (socket.error, IOError) as emsg:
+                for index, varbind in chunk:
+                    results[index] = ('Set request failed: %s' % emsg, None)
+
+                continue
+
+            # Set requests are atomic - a rejected binding fails all of them
+            if status:
+                error = (snmperrors[status] if status < len(snmperrors)
+                         else 'error %i' % status)
+
+                for number, (index, varbind) in enumerate(chunk):
+                    if errorindex in (0, number + 1):
+                        results[index] = (
+                            'Agent rejected the set request (%s)' % error,
+                            None)
+
+                    else:
+                        results[index] = (
+                            'Not set since another variable binding in the ' +
+                            'request was rejected (%s)' % error, None)
+
+                continue
+
+            for number, (index, (oid, value)) in enumerate(chunk):
+                results[index] = snmpcompare(
+                    oid, value, response[number:number + 1], 'Agent returned')
+
+        if verify:
+            verified = [(index, varbind) for index, varbind in varbinds
+                        if results[index][0] is None]
+
+            for offset in range(0, len(verified), max_varbinds):
+                chunk = verified[offset:offset + max_varbinds]
+
+                try:
+                    response = request(0xa0, [
+                        (oid, '\x05\x00') for index, (oid, value) in chunk])[4]
+
+                except (socket.error, IOError) as emsg:
+                    for index, varbind in chunk:
+                        results[index] = (
+                            'Verification request failed: %s' % emsg, None)
+
+                    continue
+
+                for number, (index, (oid, value)) in enumerate(chunk):
+                    results[index] = snmpcompare(
+                        oid, value, response[number:number + 1],
+                        'Verification read back')
+
+        return results
+
+    def execute(action):
+        logger.info('Sending SNMP set request "%s"' % action)
+
+        return executebatch([action])[0]
+
+    def report(action, result):
+        error, value = result
+
+        if error:
+            logger.error('SNMP set request "%s" failed: %s' % (action, error))
+
+            return False
+
+        logger.info('SNMP set request "%s" successful - value: "%s"'
+                    % (action, value))
+
+        return True
+
+    # Failed set requests have status 1 and their error as output
+    def outcome(result):
+        error, value = result
+
+        return error is None, int(error is not None), error or value
+
+    target = 'snmp:%s:%i' % (host, port)
+
+    if not batch:
+        return runactions(actions, wait, parallel, execute, report,
+                          coalesce, target, None, outcome)
+
+    # Actions separated by barriers are never combined into the same request
+    successful = True
+
+    stages = actionstages(actions)
+
+    for number, stage in enumerate(stages):
+        if wait and number:
+            left = remaining()
+
+            if left is not None and left - wait < minimumleft():
+                skipactions(sum(stages[number:], []), 'the deadline would ' +
+                            'be reached while waiting')
+
+                return False
+
+            logger.debug(
+                'Waiting %i second(s) before execution of next stage' % wait)
+
+            time.sleep(wait)
+
+        successful = runactions(
+            stage, wait, parallel, execute, report, coalesce, target,
+            executebatch, outcome) and successful
+
+    return successful
+
+
+# Compares the value of a variable binding in a response with the set value
+def snmpcompare(oid, value, response, source):
+    if not response:
+        return ('%s no value for "%s"' % (source, oid), None)
+
+    responseoid, tag, data = response[0]
+    expected = berdecode(value)
+
+    if responseoid != oid:
+        return ('%s value for unexpected OID "%s"' % (source, responseoid),
+                None)
+
+    if (tag, bervalue(tag, data)) != (expected[0],
+                                      bervalue(expected[0], expected[1])):
+        return ('%s "%s" instead of "%s"' % (
+            source, berformat(tag, data), berformat(*expected[:2])), None)
+
+    return (None, berformat(tag, data))
+
+
+# Executes the actions of an event with the SNMP module
+def execute(args, actions, coalesce):
+    return execmod_snmp(
+        actions, args.wait, args.parallel, coalesce, args.host,
+        args.mod_host, args.mod_port, args.mod_snmp_version,
+        args.mod_snmp_community, args.mod_snmp_user, args.mod_snmp_auth,
+        args.mod_snmp_auth_password, args.mod_snmp_priv,
+        args.mod_snmp_priv_password, args.mod_snmp_context,
+        args.mod_timeout, args.mod_snmp_retries, args.mod_snmp_max_varbinds,
+        args.mod_batch, args.mod_snmp_verify)
@@ -0,0 +1,505 @@
+'''Executes command(s) with SSH.'''
+
+try:
+    import logging
+    import threading
+    import hashlib
+    import socket
+    import errno
+    import time
+    import os
+
+    from notss_eh.core import (
+        runcommand, runactions, batchscript, batchsplit, script_path,
+        timelimit)
+
+except ImportError as excp:
+    print 'Error - could not import all required Python modules:\n"%s"' % excp
+    exit(2)
+
+logger = logging.getLogger('notss-eh')
+
+# Pool of SSH connections shared between events in long-running processes
+sshpool = {}
+sshpool_connecting = {}
+sshpool_lock = threading.Lock()
+
+
+# Adds the module arguments to the argument parser
+def arguments(parser):
+    parser.add_argument('-u', '--user',
+                        dest='mod_user',
+                        help='Username on remote host',
+                        required=True)
+
+    parser.add_argument('-H', '--host',
+                        dest='mod_host',
+                        help='Specify optional remote host for execution')
+
+    parser.add_argument('-p', '--port',
+                        dest='mod_port',
+                        help='SSH port on remote host',
+                        type=int, default=22)
+
+    # Allows the user to specify a password or private key for authentication
+    mod_ssh_auth = parser.add_mutually_exclusive_group(required=True)
+
+    mod_ssh_auth.add_argument(
+        '-k', '--private-key',
+        dest='mod_key',
+        help='OpenSSH compatible private key file for authentication')
+
+    mod_ssh_auth.add_argument(
+        '-P', '--password',
+        dest='mod_password',
+        help='Password for authentication (not recommended)')
+
+    # Allows the user to specify know host file or trust all host keys
+    mod_ssh_keypol = parser.add_mutually_exclusive_group(required=True)
+
+    mod_ssh_keypol.add_argument(
+        '-K', '--known-hosts',
+        dest='mod_known',
+        help='OpenSSH compatible known hosts file for host key verification')
+
+    mod_ssh_keypol.add_argument(
+        '-i', '--insecure',
+        dest='mod_insecure',
+        help='Automatically trust host key (not recommended)',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '-b', '--backend', dest='mod_ssh_backend',
+        help='Use the Paramiko SSH module or the system "ssh" client ' +
+        'with connection multiplexing (ControlMaster)',
+        choices=('paramiko', 'openssh'), default='paramiko')
+
+    parser.add_argument(
+        '--ssh-binary', dest='mod_ssh_binary',
+        help='Location of "ssh" executable (used with the "openssh" backend)',
+        default='/usr/bin/ssh')
+
+    parser.add_argument(
+        '--control-dir', dest='mod_control_dir',
+        help='Directory for multiplexed SSH control sockets ' +
+        '(used with the "openssh" backend)',
+        default='~/.ssh/notss-eh')
+
+    parser.add_argument(
+        '-T', '--timeout', dest='mod_timeout',
+        help='Seconds to wait for output of SSH commands',
+        type=int, default=300)
+
+    parser.add_argument(
+        '-r', '--returncode', dest='mod_ssh_retcode',
+        help='Specify return code to verify successful execution of commands',
+        type=int)
+
+    parser.add_argument(
+        '-B', '--batch', dest='mod_batch',
+        help='Execute all actions with a single remote invocation',
+        action='store_true', default=False)
+
+    parser.add_argument(
+        '--keepalive', dest='mod_keepalive',
+        help='Seconds between keepalive packets on SSH connections',
+        type=int, default=30)
+
+    parser.add_argument(
+        '--pool-idle', dest='mod_pool_idle',
+        help='Seconds before idle pooled SSH connections are closed ' +
+        '(used in daemon and drain mode and as "ControlPersist" time ' +
+        'with the "openssh" backend)',
+        type=int, default=300)
+
+    parser.add_argument(
+        '--pool-size', dest='mod_pool_size',
+        help='Maximum number of pooled SSH connections',
+        type=int, default=32)
+
+
+# Returns a pooled SSH connection, connecting if necessary
+def sshsession(paramiko, poolkey, keepalive, idle, size, reconnect=False):
+    host, port, user, key, password, known, insecure = poolkey
+
+    with sshpool_lock:
+        now = time.time()
+
+        # Evicts idle and broken connections that are not in use
+        for entrykey, entry in sshpool.items():
+            transport = entry['client'].get_transport()
+            broken = not transport or not transport.is_active()
+
+            if entry['active'] and not (
+                    broken and reconnect and entrykey == poolkey):
+                continue
+
+            if broken or now - entry['used'] > idle:
+                logger.debug('Closing pooled SSH connection to "%s@%s:%i"'
+                             % (entrykey[2], entrykey[0], entrykey[1]))
+
+                entry['client'].close()
+                del sshpool[entrykey]
+
+        if poolkey not in sshpool_connecting:
+            sshpool_connecting[poolkey] = threading.Lock()
+
+        connecting = sshpool_connecting[poolkey]
+
+    # Connections to different hosts are established concurrently
+    with connecting:
+        with sshpool_lock:
+            if poolkey in sshpool:
+                logger.debug('Reusing pooled SSH connection')
+
+                entry = sshpool[poolkey]
+                entry['used'] = time.time()
+
+                # Reconnecting handlers already hold a reference
+                if not reconnect:
+                    entry['active'] += 1
+
+                return entry['client']
+
+        session = paramiko.SSHClient()
+
+        # Disables host key verification for SSH session
+        if insecure:
+            logger.info('SSH host key verification has been disabled')
+            session.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+        else:
+            logger.debug('Loading known hosts file from "%s"' % known)
+
+            try:
+                session.load_host_keys(known)
+
+            except IOError as emsg:
+                raise paramiko.SSHException(
+                    'Failed to load known hosts file "%s": %s'
+                    % (known, emsg))
+
+        session.connect(
+            host, username=user, port=port,
+            key_filename=key, password=password)
+
+        if keepalive:
+            session.get_transport().set_keepalive(keepalive)
+
+        with sshpool_lock:
+            # Evicts the least recently used idle connection if pool is full
+            idlekeys = sorted(
+                (entry['used'], entrykey)
+                for entrykey, entry in sshpool.items() if not entry['active'])
+
+            if len(sshpool) >= size and idlekeys:
+                entrykey = idlekeys[0][1]
+
+                logger.debug('Closing pooled SSH connection to "%s@%s:%i" ' %
+                             (entrykey[2], entrykey[0], entrykey[1]) +
+                             'since the connection pool is full')
+
+                sshpool.pop(entrykey)['client'].close()
+
+            sshpool[poolkey] = {
+                'client': session, 'used': time.time(), 'active': 1}
+
+        return session
+
+
+# Releases a pooled SSH connection after use
+def sshrelease(poolkey):
+    with sshpool_lock:
+        entry = sshpool.get(poolkey)
+
+        if entry:
+            entry['used'] = time.time()
+            entry['active'] = max(entry['active'] - 1, 0)
+
+
+# Closes all pooled SSH connections
+def sshclose():
+    with sshpool_lock:
+        for entry in sshpool.values():
+            entry['client'].close()
+
+        sshpool.clear()
+
+
+# Builds a system "ssh" command line using connection multiplexing
+def sshcommand(binary, controldir, host, port, user, key, password, known,
+               insecure, persist, action):
+    import pipes
+
+    # Masters are only shared by events with the same credentials and host
+    # key policy
+    policy = hashlib.md5('%s\0%s\0%s\0%s' % (
+        key, password, known, insecure)).hexdigest()[:12]
+
+    options = [
+        binary, '-p', str(port), '-l', user,
+        '-o', 'ControlMaster=auto',
+        '-o', 'ControlPath=%s' % os.path.join(
+            controldir, '%%r@%%h:%%p-%s' % policy),
+        '-o', 'ControlPersist=%i' % persist,
+        '-o', 'ConnectTimeout=10',
+        '-o', 'ServerAliveInterval=30']
+
+    if key:
+        options.extend(['-i', key, '-o', 'BatchMode=yes'])
+
+    else:
+        options.extend([
+            '-o', 'PreferredAuthentications=password,keyboard-interactive',
+            '-o', 'NumberOfPasswordPrompts=1'])
+
+    if insecure:
+        options.extend(['-o', 'StrictHostKeyChecking=no',
+                        '-o', 'UserKnownHostsFile=/dev/null',
+                        '-o', 'LogLevel=ERROR'])
+
+    else:
+        options.extend(['-o', 'StrictHostKeyChecking=yes',
+                        '-o', 'UserKnownHostsFile=%s' % known])
+
+    options.extend([host, '--', action])
+
+    return ' '.join(pipes.quote(option) for option in options)
+
+
+# Execution module for SSH commands
+def execmod_ssh(actions, wait, parallel, coalesce, host, user, mod_host,
+                port, key, password, known, insecure,
+                keepalive, pool_idle, pool_size, backend, binary, controldir,
+                timeout, returncode, batch):
+
+    if mod_host:
+        logger.debug('A seperate execution host has been specified')
+
+        host = mod_host
+
+    logger.info(
+        'Running SSH command(s) on host "%s:%i" as user "%s"'
+        % (host, port, user))
+
+    if key:
+        logger.info('Using private key for user authentication')
+
+    else:
+        logger.info('Using password for user authentication')
+
+    def report(action, result):
+        stdout, stderr, status = result
+
+        logger.info(
+            'Output of command "%s" - stdout: "%s", stderr: "%s"'
+            % (action, str(stdout).strip(), str(stderr).strip()))
+
+        if returncode is None:
+            return True
+
+        if status is None:
+            logger.error('Command "%s" did not finish' % action)
+
+            return False
+
+        elif status == returncode:
+            logger.info(
+                'Command "%s" executed successfully ' % action +
+                '(return code %i was matched)' % returncode)
+
+            return True
+
+        else:
+            logger.error(
+                'Command "%s" did not execute successfully ' % action +
+                '(return code %i was not matched)' % returncode)
+
+            return False
+
+    # Decides if a result is successful like "report" for retry policies
+    def outcome(result):
+        stdout, stderr, status = result
+
+        return returncode is None or status == returncode, status, stdout
+
+    # Splits the output of a remote batch script into action results
+    def splitbatch(actions, marker, output):
+        return [(stdout, stderr, status) for status, stdout, stderr in
+                batchsplit(marker, len(actions), output[0], output[1])]
+
+    if backend == 'openssh':
+        logger.debug('Using system SSH client "%s" with control ' % binary +
+                     'directory "%s"' % controldir)
+
+        if insecure:
+            logger.info('SSH host key verification has been disabled')
+
+        controldir = os.path.expanduser(controldir)
+
+        # Other threads of a fan-out or daemon may create it concurrently
+        try:
+            os.makedirs(controldir, 0700)
+
+        except OSError as emsg:
+            if emsg.errno != errno.EEXIST:
+                logger.error('Failed to create control directory "%s": "%s"'
+                             % (controldir, emsg))
+
+                return False
+
+        # Passwords are provided to "ssh" by this script acting as askpass
+        environment = None
+
+        if password:
+            environment = dict(os.environ)
+            environment.update({
+                'SSH_ASKPASS': script_path,
+                'SSH_ASKPASS_REQUIRE': 'force',
+                'DISPLAY': environment.get('DISPLAY', ':0'),
+                'NOTSS_EH_ASKPASS': password})
+
+        def execute(action):
+            logger.info('Executing command "%s" over SSH' % action)
+
+            return runclient(action)
+
+        def runclient(action):
+            limited = timelimit(timeout)
+
+            status, output, timedout = runcommand(
+                sshcommand(binary, controldir, host, port, user, key,
+                           password, known, insecure, pool_idle, action),
+                '/bin/sh', limited, 65536, environment)
+
+            if timedout:
+                logger.error('SSH command "%s" timed out after %i second(s)'
+                             % (action, limited))
+
+            elif status == 255:
+                logger.error('SSH connection to host "%s" failed: "%s"'
+                             % (host, output[1].strip()))
+
+            return output[0], output[1], status
+
+        def executebatch(actions):
+            marker, script = batchscript(actions, wait)
+            logger.debug('Executing batch script over SSH:\n\n%s' % script)
+
+            stdout, stderr, status = runclient(script)
+
+            return splitbatch(actions, marker, (stdout, stderr))
+
+        return runactions(actions, wait, parallel, execute, report,
+                          coalesce, 'ssh:%s@%s:%i' % (user, host, port),
+                          batch and executebatch, outcome)
+
+    # Trying to import the Python SSH module
+    try:
+        import paramiko
+
+    except ImportError:
+        logger.error(
+            'Falied to import the Paramiko SSH module - exiting')
+
+        return False
+
+    # Connections are only shared by events with the same credentials and
+    # host key policy
+    poolkey = (host, port, user, key, password, known, insecure)
+
+    def connect(reconnect=False):
+        return sshsession(
+            paramiko, poolkey, keepalive, pool_idle, pool_size, reconnect)
+
+    # All actions run as channels on the same pooled transport
+    session = {}
+
+    def execute(action):
+        logger.info('Executing command "%s" over SSH' % action)
+
+        return runremote(action)
+
+    def runremote(action):
+        limited = timelimit(timeout)
+        expires = limited and time.time() + limited
+
+        try:
+            stdin, stdout, stderr = session['client'].exec_command(
+                action, timeout=limited)
+
+        except (paramiko.SSHException, socket.error) as emsg:
+            logger.info('Reconnecting to host "%s" after SSH error: "%s"'
+                        % (host, emsg))
+
+            session['client'] = connect(reconnect=True)
+            stdin, stdout, stderr = session['client'].exec_command(
+                action, timeout=limited)
+
+        stdin.close()
+
+        try:
+            output = stdout.read(), stderr.read()
+
+            # Commands closing their output may still keep running
+            finished = stdout.channel.status_event.wait(
+                expires and max(expires - time.time(), 0))
+
+        except socket.timeout:
+            finished = False
+
+        if not finished:
+            logger.error('SSH command "%s" timed out after %i second(s)'
+                         % (action, limited))
+
+            stdout.channel.close()
+
+            return '', '', None
+
+        return output[0], output[1], stdout.channel.recv_exit_status()
+
+    def executebatch(actions):
+        marker, script = batchscript(actions, wait)
+        logger.debug('Executing batch script over SSH:\n\n%s' % script)
+
+        stdout, stderr, status = runremote(script)
+
+        return splitbatch(actions, marker, (stdout, stderr))
+
+    try:
+        session['client'] = connect()
+
+    except (paramiko.SSHException, socket.error) as emsg:
+        logger.error('Failed to connect to host "%s": "%s"' % (host, emsg))
+
+        return False
+
+    try:
+        return runactions(actions, wait, parallel, execute, report,
+                          coalesce, 'ssh:%s@%s:%i' % (user, host, port),
+                          batch and executebatch, outcome)
+
+    except (paramiko.SSHException, socket.error) as emsg:
+        logger.error('Failed to execute command on host "%s": "%s"'
+                     % (host, emsg))
+
+        return False
+
+    finally:
+        sshrelease(poolkey)
+
+
+# Executes the actions of an event with the SSH module
+def execute(args, actions, coalesce):
+    return execmod_ssh(
+        actions, args.wait, args.parallel, coalesce, args.host,
+        args.mod_user, args.mod_host, args.mod_port,
+        args.mod_key, args.mod_password, args.mod_known, args.mod_insecure,
+        args.mod_keepalive, args.mod_pool_idle, args.mod_pool_size,
+        args.mod_ssh_backend, args.mod_ssh_binary, args.mod_control_dir,
+        args.mod_timeout, args.mod_ssh_retcode, args.mod_batch)
+
+
+# Closes pooled connections when the event-handler exits
+def close():
+    sshclose()
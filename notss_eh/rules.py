@@ -0,0 +1,372 @@
+'''notss-eh - Rules file with a precompiled lookup index.
+
+The rules file is a JSON list of rules, matched in order against the host
+name and service description of an event. The first matching rule replaces
+the actions (and optionally the execution module) provided as arguments:
+
+  [{"host": "web*", "service": "HTTP",
+    "critical": ["restart_httpd"], "unknown": ["skip"],
+    "attempt_exec": 2, "module": ["nrpe", "--insecure"]},
+   {"host_regex": "^db[0-9]+$", "service": "*",
+    "critical": ["echo down"], "soft": false, "module": ["shell"],
+    "retry": [{"action": "echo *", "attempts": 3, "status": 0}],
+    "cache": [{"action": "echo *", "ttl": 60}]}]
+
+Host and service patterns are globs ("host", "service") or regular
+expressions ("host_regex", "service_regex") and default to "*".
+The rules are compiled into an index, looked up with hash lookups of exact
+names and literal name prefixes, which is cached next to the rules file.
+
+Only cheap modules may be imported here - this is loaded by the fast path.'''
+
+import marshal
+import os
+
+# Increased when the layout of the cached index changes
+index_version = 2
+
+# Keys allowed in rules
+rule_keys = (
+    'host', 'service', 'host_regex', 'service_regex', 'ok', 'warning',
+    'critical', 'unknown', 'soft', 'attempt_exec', 'module', 'retry',
+    'cache')
+
+# Keys allowed in retry policies
+policy_keys = ('action', 'attempts', 'delay', 'max_delay', 'status', 'pattern')
+
+# Indexes loaded by the process, by rules file path
+loaded = {}
+
+
+# Returns the literal prefix of a glob or regular expression pattern
+def patternprefix(pattern, regex):
+    if not regex:
+        for number, character in enumerate(pattern):
+            if character in '*?[':
+                return pattern[:number]
+
+        return pattern
+
+    # Only anchored expressions have a prefix that every match starts with
+    if not pattern.startswith('^'):
+        return ''
+
+    # Alternatives outside of groups and inline flags (like "(?i)") may
+    # match names without the prefix
+    depth = 0
+    escaped = False
+    charclass = None
+
+    for number, character in enumerate(pattern):
+        if escaped:
+            escaped = False
+
+        elif character == '\\':
+            escaped = True
+
+        elif charclass is not None:
+            # A "]" right after "[" or "[^" is a literal character
+            if character == ']' and number > charclass + (
+                    pattern[charclass + 1:charclass + 2] == '^') + 1:
+                charclass = None
+
+        elif character == '[':
+            charclass = number
+
+        elif character == '(':
+            if pattern[number + 1:number + 2] == '?' and (
+                    pattern[number + 2:number + 3] in tuple('iLmsux')):
+                return ''
+
+            depth += 1
+
+        elif character == ')':
+            depth -= 1
+
+        elif character == '|' and not depth:
+            return ''
+
+    prefix = ''
+
+    for character in pattern[1:]:
+        if not (character.isalnum() or character in '_- '):
+            # A quantifier may make the previous character optional
+            if character in '?*{':
+                prefix = prefix[:-1]
+
+            break
+
+        prefix += character
+
+    return prefix
+
+
+# Compiles a host or service pattern of a rule for the index
+def compilepattern(rule, field):
+    import fnmatch
+    import re
+
+    if field + '_regex' in rule:
+        if field in rule:
+            raise ValueError('Both "%s" and "%s_regex" specified' % (
+                field, field))
+
+        pattern = rule[field + '_regex']
+
+        try:
+            re.compile(pattern)
+
+        except re.error as emsg:
+            raise ValueError('Invalid "%s_regex" pattern: %s' % (field, emsg))
+
+        return pattern, patternprefix(pattern, True), False
+
+    pattern = rule.get(field, '*')
+
+    if not [character for character in pattern if character in '*?[']:
+        return None, pattern, True
+
+    return (r'\A' + fnmatch.translate(pattern),
+            patternprefix(pattern, False), False)
+
+
+# Checks a retry policy of a rule or the "--retry-policy" argument
+def checkpolicy(policy):
+    if not isinstance(policy, dict):
+        raise ValueError('Retry policy is not an object')
+
+    unknown = [key for key in policy if key not in policy_keys]
+
+    if unknown:
+        raise ValueError('Unknown retry policy key(s) "%s"'
+                         % '", "'.join(unknown))
+
+    for key, kinds in (('action', basestring), ('pattern', basestring),
+                       ('attempts', int), ('status', int),
+                       ('delay', (int, float)), ('max_delay', (int, float))):
+
+        if key in policy and (not isinstance(policy[key], kinds) or
+                              isinstance(policy[key], bool)):
+            raise ValueError('Retry policy key "%s" has an invalid type' % key)
+
+    if policy.get('attempts', 1) < 1:
+        raise ValueError('Retry policy must allow at least one attempt')
+
+    if policy.get('delay', 0) < 0 or policy.get('max_delay', 0) < 0:
+        raise ValueError('Retry policy delays can not be negative')
+
+    if 'pattern' in policy:
+        import re
+
+        try:
+            re.compile(policy['pattern'])
+
+        except re.error as emsg:
+            raise ValueError('Invalid retry policy pattern: %s' % emsg)
+
+    return policy
+
+
+# Checks a result cache TTL of a rule or the "--cache-ttl" argument
+def checkcache(policy):
+    if not isinstance(policy, dict):
+        raise ValueError('Cache TTL is not an object')
+
+    unknown = [key for key in policy if key not in ('action', 'ttl')]
+
+    if unknown:
+        raise ValueError('Unknown cache TTL key(s) "%s"'
+                         % '", "'.join(unknown))
+
+    if not isinstance(policy.get('action', '*'), basestring):
+        raise ValueError('Cache TTL key "action" has an invalid type')
+
+    if isinstance(policy.get('ttl'), bool) or not isinstance(
+            policy.get('ttl'), (int, float)) or policy['ttl'] < 0:
+        raise ValueError('Cache TTL key "ttl" must be a number of seconds')
+
+    return policy
+
+
+# Converts decoded JSON strings to byte strings like command line arguments
+def utf8(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    if isinstance(value, list):
+        return [utf8(item) for item in value]
+
+    if isinstance(value, dict):
+        return dict((utf8(key), utf8(item)) for key, item in value.items())
+
+    return value
+
+
+# Compiles the rules file into rules and a lookup index
+def compilerules(path):
+    import json
+
+    with open(path) as rulesfile:
+        try:
+            document = json.load(rulesfile)
+
+        except ValueError as emsg:
+            raise ValueError('Failed to parse rules file: %s' % emsg)
+
+    if not isinstance(document, list):
+        raise ValueError('Rules file must contain a list of rules')
+
+    document = utf8(document)
+
+    rules = []
+    index = {'exact': {}, 'prefix': {}}
+
+    for number, rule in enumerate(document):
+        try:
+            if not isinstance(rule, dict):
+                raise ValueError('Rule is not an object')
+
+            unknown = [key for key in rule if key not in rule_keys]
+
+            if unknown:
+                raise ValueError('Unknown key(s) "%s"' % '", "'.join(unknown))
+
+            for state in ('ok', 'warning', 'critical', 'unknown', 'module'):
+                if state in rule and not (
+                        isinstance(rule[state], list) and
+                        all(isinstance(action, basestring)
+                            for action in rule[state])):
+                    raise ValueError('"%s" must be a list of strings' % state)
+
+            if 'module' in rule and not rule['module']:
+                raise ValueError('"module" must contain the module name')
+
+            if 'attempt_exec' in rule and not isinstance(
+                    rule['attempt_exec'], int):
+                raise ValueError('"attempt_exec" must be a number')
+
+            if 'retry' in rule:
+                if not isinstance(rule['retry'], list):
+                    raise ValueError('"retry" must be a list of policies')
+
+                for policy in rule['retry']:
+                    checkpolicy(policy)
+
+            if 'cache' in rule:
+                if not isinstance(rule['cache'], list):
+                    raise ValueError('"cache" must be a list of TTLs')
+
+                for policy in rule['cache']:
+                    checkcache(policy)
+
+            host, host_key, host_exact = compilepattern(rule, 'host')
+            service, service_key, service_exact = compilepattern(
+                rule, 'service')
+
+        except ValueError as emsg:
+            raise ValueError('Invalid rule %i in rules file: %s'
+                             % (number + 1, emsg))
+
+        compiled = dict((key, value) for key, value in rule.items()
+                        if not key.startswith(('host', 'service')))
+
+        compiled.update({'number': number + 1,
+                         'host': host, 'service': service})
+
+        rules.append(compiled)
+
+        # Rules are indexed by exact names or literal prefixes of patterns
+        services = index['exact' if host_exact else 'prefix'].setdefault(
+            host_key, {'exact': {}, 'prefix': {}})
+
+        services['exact' if service_exact else 'prefix'].setdefault(
+            service_key, []).append(number)
+
+    return rules, index
+
+
+# Loads the rules and index, compiling and caching them if outdated
+def load(path, cache=None):
+    status = os.stat(path)
+    signature = (index_version, status.st_mtime, status.st_size)
+
+    if path in loaded and loaded[path][0] == signature:
+        return loaded[path][1]
+
+    cache = cache or path + '.idx'
+    compiled = None
+
+    try:
+        with open(cache, 'rb') as cachefile:
+            cached = marshal.load(cachefile)
+
+        if cached[0] == signature:
+            compiled = cached[1]
+
+    except (IOError, EOFError, ValueError, TypeError, IndexError):
+        pass
+
+    if compiled is None:
+        rules, index = compilerules(path)
+
+        # Rules and service indexes are only decoded when they are looked up
+        compiled = ([marshal.dumps(rule) for rule in rules], dict(
+            (kind, dict((key, marshal.dumps(services))
+                        for key, services in index[kind].items()))
+            for kind in index))
+
+        # The cache is optional - the rules are compiled on every run without
+        temporary = '%s.%i' % (cache, os.getpid())
+
+        try:
+            with open(temporary, 'wb') as cachefile:
+                marshal.dump((signature, compiled), cachefile)
+
+            os.rename(temporary, cache)
+
+        except (IOError, OSError):
+            try:
+                os.unlink(temporary)
+
+            except OSError:
+                pass
+
+    loaded[path] = (signature, compiled)
+
+    return compiled
+
+
+# Returns the first rule matching the host name and service description
+def lookup(path, cache, name, description):
+    rules, index = load(path, cache)
+    candidates = []
+
+    hosts = [index['exact'].get(name)] + [
+        index['prefix'].get(name[:length]) for length in range(len(name) + 1)]
+
+    for services in hosts:
+        if not services:
+            continue
+
+        services = marshal.loads(services)
+        candidates.extend(services['exact'].get(description, ()))
+
+        for length in range(len(description) + 1):
+            candidates.extend(services['prefix'].get(description[:length], ()))
+
+    # Patterns are only evaluated for rules found in the index
+    for number in sorted(candidates):
+        rule = marshal.loads(rules[number])
+
+        if rule['host'] or rule['service']:
+            import re
+
+            if rule['host'] and not re.search(rule['host'], name):
+                continue
+
+            if rule['service'] and not re.search(rule['service'], description):
+                continue
+
+        return rule
+
+    return None
@@ -0,0 +1,104 @@
+'''Tests of the result cache.'''
+
+import argparse
+import tempfile
+import unittest
+import shutil
+import os
+
+from notss_eh import core
+
+
+# Shell module style outcome without a return code to match
+def outcome(result):
+    status, output = result
+
+    return True, status, output[0]
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.executed = []
+
+        core.eventlocal.cache = {
+            'file': os.path.join(self.directory, 'cache'),
+            'size': 65536, 'ttls': [{'action': 'ensure_*', 'ttl': 60}]}
+
+        self.policies()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Sets the retry policies of the event
+    def policies(self, **options):
+        core.eventlocal.retry = core.retrypolicies(
+            argparse.Namespace(**options))
+
+    # Executes an action twice through the cache, returning both results
+    def twice(self, status):
+        def execute(action):
+            self.executed.append(action)
+
+            return status, ('output', '')
+
+        execute = core.cached(execute, 'shell:/bin/sh:host', outcome)
+
+        return execute('ensure_probe'), execute('ensure_probe')
+
+    def test_successful_result_is_cached(self):
+        self.twice(0)
+        self.assertEqual(len(self.executed), 1)
+
+    def test_failed_result_is_not_cached(self):
+        self.twice(127)
+        self.assertEqual(len(self.executed), 2)
+
+    def test_retry_status_decides_success(self):
+        self.policies(retry_status=3)
+        self.twice(3)
+        self.assertEqual(len(self.executed), 1)
+
+    def test_retry_pattern_decides_success(self):
+        self.policies(retry_pattern='^failed$')
+        self.twice(0)
+        self.assertEqual(len(self.executed), 2)
+
+    def test_unmatched_actions_are_not_cached(self):
+        def execute(action):
+            self.executed.append(action)
+
+            return 0, ('output', '')
+
+        execute = core.cached(execute, 'shell:/bin/sh:host', outcome)
+        execute('restart_app')
+        execute('restart_app')
+
+        self.assertEqual(len(self.executed), 2)
+
+    def test_failed_batch_results_are_not_cached(self):
+        def batch(actions):
+            self.executed.extend(actions)
+
+            return [(0, ('ok', '')), (1, ('failed', ''))]
+
+        batch = core.cachedbatch(batch, 'shell:/bin/sh:host', outcome)
+        batch(['ensure_a', 'ensure_b'])
+
+        self.executed = []
+        batch = core.cachedbatch(
+            lambda actions: self.executed.extend(actions) or
+            [(0, ('ok', ''))] * len(actions), 'shell:/bin/sh:host', outcome)
+
+        batch(['ensure_a', 'ensure_b'])
+        self.assertEqual(self.executed, ['ensure_b'])
+
+    def test_cache_file_is_private(self):
+        self.twice(0)
+
+        self.assertEqual(
+            os.stat(core.eventlocal.cache['file']).st_mode & 0777, 0600)
+
+
+if __name__ == '__main__':
+    unittest.main()
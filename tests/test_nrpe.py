@@ -0,0 +1,226 @@
+'''Tests of the built-in NRPE client against a local stand-in daemon.'''
+
+import SocketServer
+import threading
+import unittest
+import logging
+import binascii
+import socket
+import struct
+
+from notss_eh.modules import nrpe
+
+
+# Builds a response packet independently of the module
+def response(version, result_code, output, packet_type=2, crc=None,
+             length=None):
+
+    if version == 2:
+        header, fields = '!hhIh', ()
+        buffer = output[:1023].ljust(1024, '\0') + '\0\0'
+
+    else:
+        buffer = output + '\0'
+        header = '!hhIhhi'
+        fields = (0, len(buffer) if length is None else length)
+
+    if crc is None:
+        crc = binascii.crc32(struct.pack(
+            header, version, packet_type, 0, result_code, *fields) +
+            buffer) & 0xffffffff
+
+    return struct.pack(
+        header, version, packet_type, crc, result_code, *fields) + buffer
+
+
+# Stand-in NRPE daemon recording queries and answering them with a reply
+class Daemon(object):
+    def __init__(self, reply):
+        self.queries = []
+
+        daemon = self
+
+        class Handler(SocketServer.BaseRequestHandler):
+            def handle(self):
+                data = ''
+
+                # Queries have a fixed size since their buffer is padded
+                while len(data) < 16 or len(data) < daemon.size(data):
+                    chunk = self.request.recv(65536)
+
+                    if not chunk:
+                        return
+
+                    data += chunk
+
+                daemon.queries.append(daemon.parse(data))
+                self.request.sendall(reply)
+
+        self.server = SocketServer.ThreadingTCPServer(
+            ('127.0.0.1', 0), Handler)
+
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+        thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def size(self, data):
+        if struct.unpack('!h', data[:2])[0] == 2:
+            return 1036
+
+        return 16 + struct.unpack('!i', data[12:16])[0]
+
+    # Decodes a query packet, checking its size and CRC
+    def parse(self, data):
+        version, packet_type, crc, result_code = struct.unpack(
+            '!hhIh', data[:10])
+
+        zeroed = data[:4] + '\0\0\0\0' + data[8:]
+
+        return {'version': version, 'type': packet_type,
+                'size': len(data), 'buffer': data[
+                    10 if version == 2 else 16:].split('\0', 1)[0],
+                'crc': crc == binascii.crc32(zeroed) & 0xffffffff}
+
+
+# Collects error messages logged by the module
+class Errors(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class NRPETest(unittest.TestCase):
+    def setUp(self):
+        self.daemon = None
+        self.errors = Errors()
+
+        logging.getLogger('notss-eh').addHandler(self.errors)
+
+    def tearDown(self):
+        logging.getLogger('notss-eh').removeHandler(self.errors)
+
+        if self.daemon:
+            self.daemon.close()
+
+    def query(self, command, version=2):
+        return nrpe.nrpequery('127.0.0.1', self.daemon.port, command,
+                              version, True, 5, 5)
+
+    def execute(self, actions, version=2):
+        return nrpe.execmod_nrpe(
+            actions, 0, None, None, '127.0.0.1', None, self.daemon.port,
+            'native', None, version, True, False, 5, 5)
+
+    def test_v2_packet(self):
+        packet = nrpe.nrpepacket(2, 1, 0, 'check_load')
+
+        self.assertEqual(len(packet), 1036)
+        self.assertEqual(struct.unpack('!hhIh', packet[:10])[:2], (2, 1))
+        self.assertEqual(packet[10:21], 'check_load\0')
+
+        # The CRC is calculated with a zeroed CRC field
+        self.assertEqual(
+            struct.unpack('!I', packet[4:8])[0],
+            binascii.crc32(packet[:4] + '\0' * 4 + packet[8:]) & 0xffffffff)
+
+    def test_v3_packet(self):
+        packet = nrpe.nrpepacket(3, 1, 0, 'check_load')
+        length = struct.unpack('!i', packet[12:16])[0]
+
+        self.assertEqual(len(packet), 16 + length)
+        self.assertEqual(packet[16:27], 'check_load\0')
+        self.assertEqual(
+            struct.unpack('!I', packet[4:8])[0],
+            binascii.crc32(packet[:4] + '\0' * 4 + packet[8:]) & 0xffffffff)
+
+    def test_v2_query(self):
+        self.daemon = Daemon(response(2, 2, 'DISK CRITICAL'))
+
+        self.assertEqual(self.query('check_disk -a -w "10 %" /'),
+                         (2, 'DISK CRITICAL'))
+
+        self.assertEqual(self.daemon.queries, [{
+            'version': 2, 'type': 1, 'size': 1036, 'crc': True,
+            'buffer': 'check_disk!-w!10 %!/'}])
+
+    def test_v3_query(self):
+        output = 'x' * 4000
+        self.daemon = Daemon(response(3, 0, output))
+
+        self.assertEqual(self.query('check_load', 3), (0, output))
+        self.assertEqual(self.daemon.queries[0]['version'], 3)
+        self.assertTrue(self.daemon.queries[0]['crc'])
+
+    def test_v4_response(self):
+        self.daemon = Daemon(response(4, 1, 'LOAD WARNING'))
+
+        self.assertEqual(self.query('check_load', 3), (1, 'LOAD WARNING'))
+
+    def test_invalid_crc(self):
+        self.daemon = Daemon(response(2, 0, 'OK', crc=12345))
+
+        self.assertRaisesRegexp(socket.error, 'invalid NRPE response',
+                                self.query, 'check_load')
+
+    def test_query_packet_response(self):
+        self.daemon = Daemon(response(2, 0, 'OK', packet_type=1))
+
+        self.assertRaisesRegexp(socket.error, 'invalid NRPE response',
+                                self.query, 'check_load')
+
+    def test_invalid_length(self):
+        for length in (nrpe.buffer_limit + 1, -1):
+            self.daemon = Daemon(response(3, 0, 'OK', length=length))
+
+            self.assertRaisesRegexp(socket.error, 'invalid buffer length',
+                                    self.query, 'check_load', 3)
+
+            self.daemon.close()
+
+    def test_unsupported_version(self):
+        self.daemon = Daemon(struct.pack('!hhIh', 5, 2, 0, 0))
+
+        self.assertRaisesRegexp(socket.error, 'Unsupported NRPE packet',
+                                self.query, 'check_load')
+
+    def test_truncated_response(self):
+        self.daemon = Daemon(response(2, 0, 'OK')[:500])
+
+        self.assertRaisesRegexp(socket.error, 'Connection closed',
+                                self.query, 'check_load')
+
+    def test_module(self):
+        self.daemon = Daemon(response(2, 0, 'OK'))
+
+        self.assertTrue(self.execute(['restart_agent', 'clear_cache']))
+        self.assertEqual([query['buffer'] for query in self.daemon.queries],
+                         ['restart_agent', 'clear_cache'])
+
+    def test_module_failure(self):
+        self.daemon = Daemon(response(2, 0, 'OK', crc=0))
+
+        self.assertFalse(self.execute(['restart_agent']))
+        self.assertIn('invalid NRPE response', self.errors.messages[0])
+
+    def test_invalid_action(self):
+        self.daemon = Daemon(response(2, 0, 'OK'))
+
+        self.assertFalse(self.execute(['restart_agent "unbalanced']))
+        self.assertEqual(self.daemon.queries, [])
+        self.assertIn('Invalid action', self.errors.messages[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
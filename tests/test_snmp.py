@@ -0,0 +1,505 @@
+'''Tests of the SNMP module against a local stand-in agent.'''
+
+import threading
+import unittest
+import logging
+import hashlib
+import socket
+import struct
+import hmac
+import time
+import os
+
+from notss_eh.modules import snmp
+
+try:
+    from Crypto.Cipher import AES, DES
+
+except ImportError:
+    AES = DES = None
+
+# Variables of the stand-in agent (read-only ones reject set requests)
+writable = {
+    '1.3.6.1.4.1.99999.1.0': (0x02, '\x00'),
+    '1.3.6.1.4.1.99999.2.0': (0x04, 'idle'),
+    '1.3.6.1.4.1.99999.3.0': (0x40, '\x00\x00\x00\x00')}
+
+readonly = {'1.3.6.1.2.1.1.5.0': (0x04, 'agent')}
+
+# Variables accepting set requests without changing their value
+ignored = {'1.3.6.1.4.1.99999.4.0': (0x02, '\x00')}
+
+engineid = '\x80\x00\x1f\x88\x04notss-eh'
+usmstats = '1.3.6.1.6.3.15.1.1.%i.0'
+
+
+# Encodes a BER field independently of the module
+def tlv(tag, value):
+    if len(value) < 0x80:
+        return chr(tag) + chr(len(value)) + value
+
+    length = struct.pack('!I', len(value)).lstrip('\0')
+
+    return chr(tag) + chr(0x80 | len(length)) + length + value
+
+
+def integer(number):
+    padding = '\xff' if number < 0 else '\0'
+    encoded = struct.pack('!q', number).lstrip(padding) or padding
+
+    if (number < 0) != bool(ord(encoded[0]) & 0x80):
+        encoded = padding + encoded
+
+    return tlv(0x02, encoded)
+
+
+def oid(dotted):
+    parts = [int(part) for part in dotted.split('.')]
+    encoded = ''
+
+    for part in [parts[0] * 40 + parts[1]] + parts[2:]:
+        chunk = chr(part & 0x7f)
+
+        while part > 0x7f:
+            part >>= 7
+            chunk = chr(0x80 | part & 0x7f) + chunk
+
+        encoded += chunk
+
+    return tlv(0x06, encoded)
+
+
+# Decodes the first BER field independently of the module
+def field(data):
+    tag, length, offset = ord(data[0]), ord(data[1]), 2
+
+    if length & 0x80:
+        offset += length & 0x7f
+        length = int(data[2:offset].encode('hex'), 16)
+
+    return tag, data[offset:offset + length], data[offset + length:]
+
+
+# Decodes the fields of a BER sequence
+def fields(data):
+    decoded = []
+
+    while data:
+        tag, value, data = field(data)
+        decoded.append((tag, value))
+
+    return decoded
+
+
+def number(value):
+    return int(value.encode('hex') or '0', 16) - (
+        1 << 8 * len(value) if value and ord(value[0]) & 0x80 else 0)
+
+
+def dotted(value):
+    parts, part = [], 0
+
+    for byte in value:
+        part = part << 7 | ord(byte) & 0x7f
+
+        if not ord(byte) & 0x80:
+            parts.append(part)
+            part = 0
+
+    return '.'.join(str(part) for part in [
+        parts[0] // 40, parts[0] % 40] + parts[1:])
+
+
+# Localizes a pass phrase for the engine of the agent (RFC 3414, A.2.1)
+def localize(hashfunc, password, engine):
+    data = (password * (1048576 // len(password) + 1))[:1048576]
+    key = hashfunc(data).digest()
+
+    return hashfunc(key + engine + key).digest()
+
+
+# Stand-in SNMP agent answering v2c and v3 get and set requests over UDP
+class Agent(object):
+    def __init__(self, community='private', user='monitor', auth=None,
+                 auth_password=None, priv=None, priv_password=None):
+
+        self.community = community
+        self.user = user
+        self.auth = auth and {'MD5': hashlib.md5, 'SHA': hashlib.sha1}[auth]
+        self.authkey = auth and localize(self.auth, auth_password, engineid)
+        self.priv = priv
+        self.privkey = priv and localize(self.auth, priv_password, engineid)
+        self.values = dict(writable)
+        self.values.update(readonly)
+        self.values.update(ignored)
+        self.requests = []
+        self.started = time.time()
+
+        self.connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.connection.bind(('127.0.0.1', 0))
+        self.port = self.connection.getsockname()[1]
+
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.connection.close()
+
+    def serve(self):
+        while True:
+            try:
+                data, address = self.connection.recvfrom(65535)
+
+            except socket.error:
+                return
+
+            response = self.handle(data)
+
+            if response:
+                self.connection.sendto(response, address)
+
+    def handle(self, data):
+        message = fields(field(data)[1])
+
+        if number(message[0][1]) == 1:
+            if message[1][1] != self.community:
+                return None
+
+            return tlv(0x30, integer(1) + tlv(0x04, self.community) +
+                       self.pdu(*message[2]))
+
+        header = fields(message[1][1])
+        msgid, flags = number(header[0][1]), ord(header[2][1])
+        security = fields(field(message[2][1])[1])
+        authparams, salt = security[4][1], security[5][1]
+
+        # Unknown engines are answered with the engine of the agent
+        if security[0][1] != engineid:
+            return self.message(msgid, 0, tlv(0xa8, (
+                integer(0) + integer(0) + integer(0) + tlv(0x30, tlv(0x30, (
+                    oid(usmstats % 4) + tlv(0x41, '\x01')))))))
+
+        if flags & 0x01:
+            digest = hmac.new(self.authkey, data.replace(
+                authparams, '\0' * 12, 1), self.auth).digest()[:12]
+
+            if security[3][1] != self.user or digest != authparams:
+                return self.message(msgid, 0, tlv(0xa8, (
+                    integer(0) + integer(0) + integer(0) + tlv(
+                        0x30, tlv(0x30, (
+                            oid(usmstats % 5) + tlv(0x41, '\x01')))))))
+
+        scoped = message[3][1]
+
+        if flags & 0x02:
+            # Decrypted DES data is padded after the scoped PDU
+            scoped = field(self.crypt(
+                number(security[1][1]), number(security[2][1]), salt,
+                scoped, False))[1]
+
+        return self.message(msgid, flags & 0x03, self.pdu(
+            *fields(scoped)[2]))
+
+    def crypt(self, boots, enginetime, salt, data, encrypt):
+        if self.priv == 'DES':
+            iv = ''.join(chr(ord(a) ^ ord(b))
+                         for a, b in zip(self.privkey[8:16], salt))
+
+            cipher = DES.new(self.privkey[:8], DES.MODE_CBC, iv)
+
+        else:
+            cipher = AES.new(
+                self.privkey[:16], AES.MODE_CFB,
+                struct.pack('!II', boots, enginetime) + salt,
+                segment_size=128)
+
+        if not encrypt:
+            return cipher.decrypt(data)
+
+        if self.priv == 'DES':
+            data += '\0' * (-len(data) % 8)
+
+        return cipher.encrypt(data)
+
+    def message(self, msgid, flags, pdu):
+        boots, enginetime = 1, int(time.time() - self.started)
+        scoped = tlv(0x30, tlv(0x04, engineid) + tlv(0x04, '') + pdu)
+        salt = ''
+
+        if flags & 0x02:
+            salt = os.urandom(8)
+            scoped = tlv(0x04, self.crypt(
+                boots, enginetime, salt, scoped, True))
+
+        def build(authparams):
+            return tlv(0x30, integer(3) + tlv(0x30, (
+                integer(msgid) + integer(65507) + tlv(0x04, chr(flags)) +
+                integer(3))) + tlv(0x04, tlv(0x30, (
+                    tlv(0x04, engineid) + integer(boots) +
+                    integer(enginetime) + tlv(0x04, self.user) +
+                    tlv(0x04, authparams) + tlv(0x04, salt)))) + scoped)
+
+        if not flags & 0x01:
+            return build('')
+
+        return build(hmac.new(
+            self.authkey, build('\0' * 12), self.auth).digest()[:12])
+
+    def pdu(self, pdutype, pdu):
+        pdu = fields(pdu)
+        requestid, status, index = pdu[0][1], 0, 0
+        varbinds = [fields(varbind) for tag, varbind in fields(pdu[3][1])]
+        self.requests.append((pdutype, len(varbinds)))
+
+        if pdutype == 0xa3:
+            for position, ((tag, name), value) in enumerate(varbinds):
+                current = self.values.get(dotted(name))
+
+                if dotted(name) in readonly:
+                    status, index = 17, position + 1
+
+                elif current is None:
+                    status, index = 11, position + 1
+
+                elif current[0] != value[0]:
+                    status, index = 7, position + 1
+
+                if status:
+                    break
+
+            # Set requests are applied completely or not at all
+            for (tag, name), value in varbinds:
+                if not status and dotted(name) not in ignored:
+                    self.values[dotted(name)] = value
+
+        else:
+            varbinds = [
+                ((tag, name), self.values.get(dotted(name), (0x81, '')))
+                for (tag, name), value in varbinds]
+
+        return tlv(0xa2, (
+            tlv(0x02, requestid) + integer(status) + integer(index) +
+            tlv(0x30, ''.join(tlv(0x30, (
+                tlv(tag, name) + tlv(*value)))
+                for (tag, name), value in varbinds))))
+
+
+# Collects error messages logged by the module
+class Errors(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SNMPTest(unittest.TestCase):
+    def setUp(self):
+        self.agent = None
+        self.errors = Errors()
+
+        logging.getLogger('notss-eh').addHandler(self.errors)
+
+    def tearDown(self):
+        logging.getLogger('notss-eh').removeHandler(self.errors)
+
+        if self.agent:
+            self.agent.close()
+
+    # Sends actions to the stand-in agent, returning if all were successful
+    def execute(self, actions, version='2c', community='private',
+                user='monitor', auth='SHA', auth_password=None, priv='AES',
+                priv_password=None, max_varbinds=32, batch=True,
+                verify=False):
+
+        return snmp.execmod_snmp(
+            actions, 0, None, None, '127.0.0.1', None, self.agent.port,
+            version, community, user, auth, auth_password, priv,
+            priv_password, '', 1, 0, max_varbinds, batch, verify)
+
+    def value(self, name):
+        return self.agent.values[name]
+
+    def test_encoding(self):
+        self.assertEqual(snmp.beroid('1.3.6.1.4.1.99999.1.0'),
+                         oid('1.3.6.1.4.1.99999.1.0'))
+
+        for value in (0, 127, 128, 255, 256, -1, -128, -129, 2 ** 31 - 1):
+            self.assertEqual(snmp.berinteger(value), integer(value))
+
+        self.assertEqual(snmp.bervalue(0x02, integer(-129)[2:]), -129)
+        self.assertEqual(snmp.berlength(300), '\x82\x01\x2c')
+
+    # Test vectors of RFC 3414, A.3.1 and A.3.2
+    def test_key_localization(self):
+        engine = '\0' * 11 + '\x02'
+
+        self.assertEqual(
+            snmp.usmkey(hashlib.md5, 'maplesyrup', engine).encode('hex'),
+            '526f5eed9fcce26f8964c2930787d82b')
+
+        self.assertEqual(
+            snmp.usmkey(hashlib.sha1, 'maplesyrup', engine).encode('hex'),
+            '6695febc9288e36282235fc7151f128497b38f3f')
+
+    def test_v2c_set(self):
+        self.agent = Agent()
+
+        self.assertTrue(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 42',
+            '1.3.6.1.4.1.99999.2.0 s "running now"',
+            '1.3.6.1.4.1.99999.3.0 a 192.0.2.10']))
+
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.1.0'), (0x02, '\x2a'))
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.2.0'),
+                         (0x04, 'running now'))
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.3.0'),
+                         (0x40, '\xc0\x00\x02\x0a'))
+
+        # All actions are combined into a single set request
+        self.assertEqual(self.agent.requests, [(0xa3, 3)])
+
+    def test_v2c_wrong_community(self):
+        self.agent = Agent()
+
+        self.assertFalse(self.execute(['1.3.6.1.4.1.99999.1.0 i 1'],
+                                      community='public'))
+
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.1.0'), (0x02, '\x00'))
+
+    def test_max_varbinds(self):
+        self.agent = Agent()
+
+        self.assertTrue(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 1', '1.3.6.1.4.1.99999.2.0 s a',
+            '1.3.6.1.4.1.99999.3.0 a 192.0.2.1', '1.3.6.1.4.1.99999.4.0 i 1',
+            '1.3.6.1.4.1.99999.2.0 s b'], max_varbinds=2))
+
+        self.assertEqual(self.agent.requests,
+                         [(0xa3, 2), (0xa3, 2), (0xa3, 1)])
+
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.2.0'), (0x04, 'b'))
+
+    def test_no_batch(self):
+        self.agent = Agent()
+
+        self.assertTrue(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 1', '1.3.6.1.4.1.99999.2.0 s a'],
+            batch=False))
+
+        self.assertEqual(self.agent.requests, [(0xa3, 1), (0xa3, 1)])
+
+    def test_barrier(self):
+        self.agent = Agent()
+
+        self.assertTrue(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 1', 'barrier',
+            '1.3.6.1.4.1.99999.2.0 s a']))
+
+        self.assertEqual(self.agent.requests, [(0xa3, 1), (0xa3, 1)])
+
+    def test_error_status(self):
+        self.agent = Agent()
+
+        self.assertFalse(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 7', '1.3.6.1.2.1.1.5.0 s renamed']))
+
+        # The rejected binding fails the request and nothing is set
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.1.0'), (0x02, '\x00'))
+        self.assertEqual(self.value('1.3.6.1.2.1.1.5.0'), (0x04, 'agent'))
+
+        self.assertTrue([message for message in self.errors.messages
+                         if '"1.3.6.1.2.1.1.5.0 s renamed"' in message and
+                         'rejected the set request (notWritable)' in message])
+
+        self.assertTrue([message for message in self.errors.messages
+                         if '"1.3.6.1.4.1.99999.1.0 i 7"' in message and
+                         'another variable binding' in message])
+
+    def test_wrong_type(self):
+        self.agent = Agent()
+
+        self.assertFalse(self.execute(['1.3.6.1.4.1.99999.2.0 i 1']))
+        self.assertTrue([message for message in self.errors.messages
+                         if 'wrongType' in message])
+
+    def test_invalid_action(self):
+        self.agent = Agent()
+
+        self.assertFalse(self.execute([
+            '1.3.6.1.4.1.99999.1.0 x zz', '1.3.6.1.4.1.99999.2.0 s a']))
+
+        # Valid actions of the batch are still sent
+        self.assertEqual(self.agent.requests, [(0xa3, 1)])
+        self.assertEqual(self.value('1.3.6.1.4.1.99999.2.0'), (0x04, 'a'))
+
+    def test_verify(self):
+        self.agent = Agent()
+
+        self.assertTrue(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 3', '1.3.6.1.4.1.99999.2.0 s a'],
+            verify=True))
+
+        self.assertEqual(self.agent.requests, [(0xa3, 2), (0xa0, 2)])
+
+    def test_verify_mismatch(self):
+        self.agent = Agent()
+
+        self.assertFalse(self.execute([
+            '1.3.6.1.4.1.99999.1.0 i 3', '1.3.6.1.4.1.99999.4.0 i 5'],
+            verify=True, max_varbinds=1))
+
+        self.assertEqual(self.agent.requests,
+                         [(0xa3, 1), (0xa3, 1), (0xa0, 1), (0xa0, 1)])
+
+        self.assertEqual(len(self.errors.messages), 1)
+        self.assertIn('Verification read back "0" instead of "5"',
+                      self.errors.messages[0])
+
+    def test_v3_auth(self):
+        for auth in ('MD5', 'SHA'):
+            self.agent = Agent(auth=auth, auth_password='authpass1')
+
+            self.assertTrue(self.execute(
+                ['1.3.6.1.4.1.99999.2.0 s %s' % auth], version='3',
+                auth=auth, auth_password='authpass1', verify=True))
+
+            self.assertEqual(self.value('1.3.6.1.4.1.99999.2.0'),
+                             (0x04, auth))
+
+            self.agent.close()
+
+    def test_v3_wrong_auth_password(self):
+        self.agent = Agent(auth='SHA', auth_password='authpass1')
+
+        self.assertFalse(self.execute(
+            ['1.3.6.1.4.1.99999.2.0 s a'], version='3',
+            auth_password='wrongpass'))
+
+        self.assertTrue([message for message in self.errors.messages
+                         if 'wrong digest' in message])
+
+    @unittest.skipIf(AES is None, 'PyCrypto is not installed')
+    def test_v3_priv(self):
+        for priv in ('DES', 'AES'):
+            self.agent = Agent(auth='SHA', auth_password='authpass1',
+                               priv=priv, priv_password='privpass1')
+
+            self.assertTrue(self.execute(
+                ['1.3.6.1.4.1.99999.1.0 i 300',
+                 '1.3.6.1.4.1.99999.2.0 s "%s"' % ('x' * 200)],
+                version='3', auth_password='authpass1', priv=priv,
+                priv_password='privpass1', verify=True))
+
+            self.assertEqual(self.value('1.3.6.1.4.1.99999.1.0'),
+                             (0x02, '\x01\x2c'))
+
+            self.assertEqual(self.agent.requests, [(0xa3, 2), (0xa0, 2)])
+            self.agent.close()
+
+
+if __name__ == '__main__':
+    unittest.main()